@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline do monitor de leiautes
+- Servidor HTTP local no lugar do bcb.gov.br: páginas sintéticas no formato que os
+  extratores esperam (datas em <td>, links /atual/, linha 4111 em <tr>) e anexos com
+  ETag/Last-Modified/latência configuráveis (HEAD, GET, Range/multi-range e 304)
+- Servidor SMTP local que só recebe e descarta as mensagens
+- Mede o tempo total de main() e o tempo por etapa (spans de `metricas` do monitor),
+  de 6 a centenas de páginas
+
+Uso:
+    python3 bench/bench_leiautes.py --paginas 6 50 200 --anexos-por-pagina 10
+"""
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from email.utils import format_datetime
+from urllib.parse import unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import argparse, hashlib, json, logging, re, shutil, socketserver, sys, tempfile, threading, time
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+import verifica_leiautes_finaud as mon  # noqa: E402
+
+# spans de etapa registrados por main() em mon.metricas
+ETAPAS = ["paginas", "checagem_anexos", "downloads", "montagem_email", "envio_smtp"]
+
+
+# ====== SITE FALSO ======
+class SiteFalso:
+    """Estado do site simulado: páginas, anexos e a versão atual de cada anexo."""
+
+    def __init__(self, paginas, anexos_por_pagina, tamanho_anexo, latencia_pagina, latencia_anexo,
+                 validadores=True, multirange=True, data_hoje=None):
+        self.paginas = paginas
+        self.anexos_por_pagina = anexos_por_pagina
+        self.tamanho_anexo = tamanho_anexo
+        self.latencia_pagina = latencia_pagina
+        self.latencia_anexo = latencia_anexo
+        self.validadores = validadores
+        self.multirange = multirange
+        self.data_hoje = data_hoje
+        self.versoes = {}
+        self.requisicoes = {"GET": 0, "HEAD": 0, "304": 0}
+        self.bytes_enviados = 0
+        self.lock = threading.Lock()
+
+    def nome_pagina(self, i):
+        # a última página é a do 4111, tratada à parte pelo extrator
+        if i == self.paginas - 1:
+            return "leiautedocumentoscrd"
+        return f"leiautedoc{1000 + i}"
+
+    def url_paginas(self, base):
+        return [f"{base}/estabilidadefinanceira/{self.nome_pagina(i)}" for i in range(self.paginas)]
+
+    def anexos_da_pagina(self, i):
+        ext = ("pdf", "xsd", "xlsx", "zip")
+        return [f"/content/estabilidadefinanceira/leiautes/p{i}/atual/Documento {i}-{k}.{ext[k % len(ext)]}"
+                for k in range(self.anexos_por_pagina)]
+
+    def html_pagina(self, i):
+        linhas = []
+        scd = self.nome_pagina(i) == "leiautedocumentoscrd"
+        for k, caminho in enumerate(self.anexos_da_pagina(i)):
+            data = self.data_hoje if (k == 0 and i % 3 == 0 and self.data_hoje) else f"{(k % 28) + 1:02d}/01/2024"
+            # na linha do 4111 o monitor pega todos os links: versões anteriores ficam só nas outras páginas
+            anterior = "" if scd else f'<td><a href="/content/p{i}/versoes_anteriores/v{k}.pdf">anterior</a></td>'
+            linhas.append(f'<tr><td>{"4111" if scd else f"Doc {i}.{k}"}</td><td>{data}</td>'
+                          f'<td><a href="{caminho}">Leiaute</a></td>{anterior}</tr>')
+        return ("<!DOCTYPE html><html><head><title>Leiaute</title>"
+                "<script>window.dataLayer=[];</script><link rel='stylesheet' href='/static/site.css'></head>"
+                f"<body><header><img src='/static/banner_{i % 4}.png' alt=''></header><main><table><thead><tr><th>Documento</th><th>Data</th><th>Arquivo</th></tr></thead>"
+                f"<tbody>{''.join(linhas)}</tbody></table></main></body></html>")
+
+    def alterar(self, fracao):
+        """Cria uma nova versão de uma fração dos anexos; devolve quantos mudaram."""
+        todos = [c for i in range(self.paginas) for c in self.anexos_da_pagina(i)]
+        passo = max(1, round(1 / fracao)) if fracao > 0 else 0
+        alterados = todos[::passo] if passo else []
+        with self.lock:
+            for c in alterados:
+                self.versoes[c] = self.versoes.get(c, 0) + 1
+        return len(alterados)
+
+    def conteudo(self, caminho):
+        versao = self.versoes.get(caminho, 0)
+        semente = hashlib.sha256(f"{caminho}#{versao}".encode()).digest()
+        return (semente * (self.tamanho_anexo // len(semente) + 1))[:self.tamanho_anexo], versao
+
+
+def _handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _enviar(self, status, headers, corpo=b"", com_corpo=True):
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            # sem validadores, o HEAD também não informa o tamanho (como alguns servidores do Bacen)
+            if com_corpo or site.validadores:
+                self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            if com_corpo and corpo:
+                self.wfile.write(corpo)
+                with site.lock:
+                    site.bytes_enviados += len(corpo)
+
+        def _responder(self, com_corpo):
+            caminho = unquote(self.path.split("?", 1)[0])
+            with site.lock:
+                site.requisicoes[self.command] = site.requisicoes.get(self.command, 0) + 1
+
+            m = re.match(r"^/estabilidadefinanceira/(.+)$", caminho)
+            if m:
+                time.sleep(site.latencia_pagina)
+                for i in range(site.paginas):
+                    if site.nome_pagina(i) == m.group(1):
+                        corpo = site.html_pagina(i).encode("utf-8")
+                        return self._enviar(200, {"Content-Type": "text/html; charset=utf-8"}, corpo, com_corpo)
+                return self._enviar(404, {}, b"", com_corpo)
+
+            if caminho.startswith("/static/"):
+                # peso de imagens/fontes do site real, que o carregamento enxuto não baixa
+                time.sleep(site.latencia_anexo)
+                if caminho.endswith(".css"):
+                    css = b"@font-face{font-family:R;src:url(/static/fonte.woff2)}body{font-family:R}"
+                    return self._enviar(200, {"Content-Type": "text/css"}, css, com_corpo)
+                tipo = "font/woff2" if caminho.endswith(".woff2") else "image/png"
+                return self._enviar(200, {"Content-Type": tipo}, b"\0" * 96 * 1024, com_corpo)
+
+            if "/atual/" not in caminho:
+                return self._enviar(404, {}, b"", com_corpo)
+            time.sleep(site.latencia_anexo)
+            corpo, versao = site.conteudo(caminho)
+            etag = f'"{hashlib.md5(caminho.encode()).hexdigest()[:12]}-{versao}"'
+            lm = format_datetime(datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(days=versao), usegmt=True)
+            headers = {"Content-Type": "application/octet-stream"}
+            if site.validadores:
+                headers.update({"ETag": etag, "Last-Modified": lm})
+                if self.headers.get("If-None-Match") == etag:
+                    with site.lock:
+                        site.requisicoes["304"] += 1
+                    return self._enviar(304, {"ETag": etag}, b"", False)
+
+            faixas = [(int(a), min(int(b or len(corpo) - 1), len(corpo) - 1))
+                      for a, b in re.findall(r"(\d+)-(\d*)", self.headers.get("Range", ""))]
+            if len(faixas) == 1:
+                ini, fim = faixas[0]
+                headers["Content-Range"] = f"bytes {ini}-{fim}/{len(corpo)}"
+                return self._enviar(206, headers, corpo[ini:fim + 1], com_corpo)
+            if faixas and site.multirange:
+                fronteira = "bench" + hashlib.md5(caminho.encode()).hexdigest()[:16]
+                partes = b"".join(
+                    f"--{fronteira}\r\nContent-Type: application/octet-stream\r\n"
+                    f"Content-Range: bytes {a}-{b}/{len(corpo)}\r\n\r\n".encode() + corpo[a:b + 1] + b"\r\n"
+                    for a, b in faixas)
+                headers["Content-Type"] = f"multipart/byteranges; boundary={fronteira}"
+                return self._enviar(206, headers, partes + f"--{fronteira}--\r\n".encode(), com_corpo)
+            return self._enviar(200, headers, corpo, com_corpo)
+
+        def do_GET(self):
+            self._responder(True)
+
+        def do_HEAD(self):
+            self._responder(False)
+
+    return Handler
+
+
+class _ServidorHTTP(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # o monitor fecha de propósito respostas que não vai ler até o fim
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+# ====== SMTP FALSO ======
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(b"220 bench ESMTP\r\n")
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            cmd = linha.strip().upper()
+            if cmd.startswith(b"EHLO"):
+                self.wfile.write(b"250-bench\r\n250-8BITMIME\r\n250 SIZE 104857600\r\n")
+            elif cmd.startswith((b"HELO", b"MAIL", b"RCPT", b"RSET", b"NOOP")):
+                self.wfile.write(b"250 OK\r\n")
+            elif cmd == b"DATA":
+                self.wfile.write(b"354 fim com <CRLF>.<CRLF>\r\n")
+                total = 0
+                for dado in self.rfile:
+                    if dado == b".\r\n":
+                        break
+                    total += len(dado)
+                with self.server.lock:
+                    self.server.mensagens += 1
+                    self.server.bytes_recebidos += total
+                self.wfile.write(b"250 OK queued\r\n")
+            elif cmd == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:
+                self.wfile.write(b"502 not implemented\r\n")
+
+
+class SMTPFalso(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.mensagens = 0
+        self.bytes_recebidos = 0
+
+
+# ====== EXECUÇÃO ======
+def _preparar_monitor(tmp, urls_paginas, smtp_porta):
+    mon.urls = urls_paginas
+    mon.MANIFEST_DB_PATH = tmp / "manifest.sqlite3"
+    mon.MANIFEST_PATH = tmp / "manifest_arquivos.json"
+    mon.CACHE_ANEXOS_DIR = tmp / "anexos_cache"
+    mon.EMAIL_TMP_DIR = tmp / "email_tmp"
+    mon.OUTBOX_DIR = tmp / "outbox"
+    mon.SNAPSHOTS_DIR = tmp / "snapshots"
+    mon.TAIL_PATH_BASE = str(tmp / "_status_tail.txt")
+    mon.CONFIG_PATH = tmp / "config_email.json"
+    mon.CONFIG_PATH.write_text(json.dumps({
+        "from": "bench@localhost", "to": ["destino@localhost"],
+        "smtp": {"host": "127.0.0.1", "port": smtp_porta, "ssl": False, "tls": False},
+    }), encoding="utf-8")
+
+
+def executar_cenario(args, paginas, smtp):
+    site = SiteFalso(paginas, args.anexos_por_pagina, args.tamanho_anexo,
+                     args.latencia_pagina_ms / 1000, args.latencia_anexo_ms / 1000,
+                     validadores=not args.sem_validadores, multirange=not args.sem_multirange,
+                     data_hoje=mon.hoje)
+    srv = _ServidorHTTP(("127.0.0.1", 0), _handler(site))
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{srv.server_port}"
+
+    linhas = []
+    with tempfile.TemporaryDirectory(prefix="bench_leiautes_") as d:
+        _preparar_monitor(Path(d), site.url_paginas(base), smtp.server_address[1])
+        rodadas = [("fria", None), ("sem mudança", 0.0)]
+        if args.fracao_alterada > 0:
+            rodadas.append((f"{args.fracao_alterada:.0%} alterados", args.fracao_alterada))
+        for nome, fracao in rodadas:
+            if fracao:
+                site.alterar(fracao)
+            antes = dict(site.requisicoes), site.bytes_enviados, smtp.mensagens
+            mon.metricas.reiniciar()
+            t0 = time.perf_counter()
+            result = mon.main()
+            total = time.perf_counter() - t0
+            dados = mon.metricas.como_dict()
+            linhas.append({
+                "paginas": paginas,
+                "anexos": paginas * args.anexos_por_pagina,
+                "rodada": nome,
+                "alterados": len(result["alterados"]),
+                "motivos_parciais": result["motivos_parciais"],
+                "emails": smtp.mensagens - antes[2],
+                "requisicoes": {k: v - antes[0].get(k, 0) for k, v in site.requisicoes.items()},
+                "bytes_http": site.bytes_enviados - antes[1],
+                "total_s": round(total, 4),
+                "etapas_s": {k: dados["etapas"].get(k, {}).get("total_s", 0.0) for k in ETAPAS},
+                "contadores": dados["contadores"],
+            })
+    srv.shutdown()
+    return linhas
+
+
+def _imprimir(linhas):
+    cab = ["páginas", "anexos", "rodada", "alter.", "total(s)"] + [e.replace("_", " ") for e in ETAPAS]
+    print(" | ".join(f"{c:>14}" for c in cab))
+    for l in linhas:
+        vals = [l["paginas"], l["anexos"], l["rodada"], l["alterados"], f"{l['total_s']:.3f}"]
+        vals += [f"{l['etapas_s'][e]:.3f}" for e in ETAPAS]
+        print(" | ".join(f"{str(v):>14}" for v in vals))
+
+
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark offline do monitor de leiautes")
+    ap.add_argument("--paginas", type=int, nargs="+", default=[6, 50, 200],
+                    help="quantidades de páginas, um cenário por valor (padrão: 6 50 200)")
+    ap.add_argument("--anexos-por-pagina", type=int, default=5)
+    ap.add_argument("--tamanho-anexo", type=int, default=16 * 1024, help="bytes por anexo")
+    ap.add_argument("--latencia-pagina-ms", type=float, default=50)
+    ap.add_argument("--latencia-anexo-ms", type=float, default=20)
+    ap.add_argument("--fracao-alterada", type=float, default=0.1,
+                    help="fração dos anexos alterada antes da terceira rodada (0 desliga)")
+    ap.add_argument("--sem-validadores", action="store_true",
+                    help="anexos sem ETag/Last-Modified/Content-Length (força o fingerprint por Range)")
+    ap.add_argument("--sem-multirange", action="store_true",
+                    help="ignora Range com várias faixas (responde 200 com o arquivo inteiro)")
+    ap.add_argument("--modo", choices=["auto", "http", "playwright"], default=None,
+                    help="MODO_EXTRACAO do monitor (padrão: o do monitor)")
+    ap.add_argument("--carregamento-completo", action="store_true",
+                    help="desliga o carregamento enxuto do Chromium (compara com --modo playwright)")
+    ap.add_argument("--req-por-s", type=float, default=0,
+                    help="limite de requisições por segundo por host do monitor (padrão: 0, sem limite)")
+    ap.add_argument("--prazo-s", type=float, default=None,
+                    help="prazo da execução do monitor (padrão: o do monitor)")
+    ap.add_argument("--json", metavar="ARQUIVO", help="grava os resultados em JSON")
+    ap.add_argument("-v", "--verbose", action="store_true", help="mostra o log do monitor")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.modo:
+        mon.MODO_EXTRACAO = args.modo
+    if args.carregamento_completo:
+        mon.CARREGAMENTO_ENXUTO = False
+    mon.HOST_REQ_POR_S = args.req_por_s
+    if args.prazo_s is not None:
+        mon.PRAZO_EXECUCAO_S = args.prazo_s
+    logs = None
+    if args.verbose:
+        # o arquivo de log do monitor fica numa pasta temporária, não no logs/ do repositório
+        logs = Path(tempfile.mkdtemp(prefix="bench_leiautes_logs_"))
+        mon.LOG_DIR, mon.LOG_FILE, mon.METRICAS_DIR = logs, logs / mon.LOG_FILE.name, logs / "metricas"
+        mon._configurar_logging()
+    else:
+        mon.logger.setLevel(logging.ERROR)
+
+    smtp = SMTPFalso()
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+    linhas = []
+    try:
+        for paginas in args.paginas:
+            linhas.extend(executar_cenario(args, paginas, smtp))
+    finally:
+        smtp.shutdown()
+        if logs is not None:
+            mon._encerrar_logging()
+            shutil.rmtree(logs, ignore_errors=True)
+
+    _imprimir(linhas)
+    if args.json:
+        Path(args.json).write_text(json.dumps(linhas, indent=2, ensure_ascii=False), encoding="utf-8")
+    return linhas
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Checagens rápidas das partes do monitor que o benchmark não exercita caso a caso
+- Leitura de faixas (fingerprint por amostragem): multipart/byteranges válido, com
+  boundary que não bate com o corpo, 206 de parte única, 200 (Range ignorado) e o
+  fallback de uma requisição por faixa
+- URL canônica e IndiceUrls: caixa, %-codificação, barra no fim, fragmento, porta
+  padrão e aliases gravados no manifest
+
+Sem rede: as respostas HTTP saem de uma sessão falsa em memória.
+
+Uso:
+    python3 -m pytest -q bench/test_leiautes.py
+    python3 bench/test_leiautes.py
+"""
+
+from pathlib import Path
+
+import hashlib, re, sys, tempfile
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+import verifica_leiautes_finaud as mon  # noqa: E402
+
+
+# ====== HTTP FALSO ======
+ARQUIVO = bytes(range(256)) * 64  # 16 KB com conteúdo distinto em cada posição
+
+class RespostaFalsa:
+    def __init__(self, status, corpo=b"", headers=None):
+        self.status_code = status
+        self.headers = headers or {}
+        self._corpo = corpo
+
+    def iter_content(self, tamanho):
+        for i in range(0, len(self._corpo), tamanho):
+            yield self._corpo[i:i + tamanho]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise mon.requests.HTTPError(f"status {self.status_code}")
+
+    def close(self):
+        pass
+
+class SessaoFalsa:
+    """
+    Responde ao GET com Range a partir de ARQUIVO. `multi` decide a resposta a um
+    pedido com várias faixas: "multipart", "boundary_errado", "fundidas" ou "200".
+    `simples` decide a de uma faixa só: "206" ou "200".
+    """
+
+    def __init__(self, multi="multipart", simples="206"):
+        self.multi = multi
+        self.simples = simples
+        self.pedidos = []
+
+    def get(self, url, headers=None, **kw):
+        faixas = [tuple(int(x) for x in f.split("-"))
+                  for f in re.match(r"bytes=(.*)", headers["Range"]).group(1).split(",")]
+        self.pedidos.append(faixas)
+        total = len(ARQUIVO)
+        modo = self.multi if len(faixas) > 1 else self.simples
+        if modo == "200":
+            return RespostaFalsa(200, ARQUIVO, {"Content-Type": "application/pdf"})
+        if modo == "206":
+            a, b = faixas[0]
+            return RespostaFalsa(206, ARQUIVO[a:b + 1], {"Content-Range": f"bytes {a}-{b}/{total}"})
+        if modo == "fundidas":
+            a, b = faixas[0][0], faixas[-1][1]
+            return RespostaFalsa(206, ARQUIVO[a:b + 1], {"Content-Range": f"bytes {a}-{b}/{total}",
+                                                          "Content-Type": "application/pdf"})
+        corpo = b""
+        for a, b in faixas:
+            corpo += (b"\r\n--SEPARADOR\r\nContent-Type: application/pdf\r\n"
+                      + f"Content-Range: bytes {a}-{b}/{total}\r\n\r\n".encode() + ARQUIVO[a:b + 1])
+        corpo += b"\r\n--SEPARADOR--\r\n"
+        boundary = "OUTRO" if modo == "boundary_errado" else "SEPARADOR"
+        return RespostaFalsa(206, corpo, {"Content-Type": f"multipart/byteranges; boundary={boundary}"})
+
+FAIXAS = [(1024, 2047), (5000, 6023), (15360, 16383)]
+
+def _esperado(faixas=FAIXAS):
+    return {a: ARQUIVO[a:b + 1] for a, b in faixas}
+
+
+# ====== FAIXAS (MULTI-RANGE) ======
+def test_multipart_byteranges():
+    sessao = SessaoFalsa("multipart")
+    assert mon._ler_faixas(sessao, "http://x/a.pdf", FAIXAS) == _esperado()
+    assert len(sessao.pedidos) == 1
+
+def test_partes_byteranges_com_parte_truncada():
+    corpo = SessaoFalsa("multipart").get("u", {"Range": "bytes=0-9,20-29"})._corpo
+    assert mon._partes_byteranges(corpo, "SEPARADOR") == {0: ARQUIVO[0:10], 20: ARQUIVO[20:30]}
+    # corpo cortado no meio do cabeçalho da segunda parte: fica só a primeira
+    assert mon._partes_byteranges(corpo[:corpo.find(b"Content-Range: bytes 20")], "SEPARADOR") == {0: ARQUIVO[0:10]}
+
+def test_boundary_que_nao_bate_cai_para_uma_faixa_por_vez():
+    sessao = SessaoFalsa("boundary_errado")
+    assert mon._ler_faixas(sessao, "http://x/a.pdf", FAIXAS) == _esperado()
+    assert sessao.pedidos == [FAIXAS] + [[f] for f in FAIXAS]
+
+def test_206_de_parte_unica_com_as_faixas_fundidas():
+    faixas = [(1024, 2047), (2048, 3071), (3500, 4523)]
+    sessao = SessaoFalsa("fundidas")
+    assert mon._ler_faixas(sessao, "http://x/a.pdf", faixas) == _esperado(faixas)
+    assert len(sessao.pedidos) == 1
+
+def test_206_de_parte_unica_grande_demais_cai_para_uma_faixa_por_vez():
+    faixas = [(0, 9), (16000, 16009)]  # fundidas dariam ~16 KB para 20 bytes pedidos
+    sessao = SessaoFalsa("fundidas")
+    assert mon._ler_faixas(sessao, "http://x/a.pdf", faixas) == _esperado(faixas)
+    assert sessao.pedidos == [faixas, [faixas[0]], [faixas[1]]]
+
+def test_200_no_multi_range_cai_para_uma_faixa_por_vez():
+    sessao = SessaoFalsa("200")
+    assert mon._ler_faixas(sessao, "http://x/a.pdf", FAIXAS) == _esperado()
+    assert len(sessao.pedidos) == 1 + len(FAIXAS)
+
+def test_servidor_sem_range_nenhum_vira_erro():
+    try:
+        mon._ler_faixas(SessaoFalsa("200", simples="200"), "http://x/a.pdf", FAIXAS)
+    except mon.requests.HTTPError as e:
+        assert "Range ignorado" in str(e)
+    else:
+        raise AssertionError("esperava HTTPError")
+
+def test_fingerprint_igual_com_e_sem_multipart():
+    fps = {modo: mon.small_range_fingerprint(SessaoFalsa(modo), "http://x/a.pdf")
+           for modo in ("multipart", "boundary_errado", "fundidas", "200")}
+    assert len(set(fps.values())) == 1, fps
+    assert fps["multipart"].startswith(f"{mon.FP_VERSAO}:")
+
+def test_fingerprint_com_200_usa_so_o_primeiro_bloco():
+    sessao = SessaoFalsa(simples="200")
+    fp = mon.small_range_fingerprint(sessao, "http://x/a.pdf")
+    h = hashlib.sha256(b"None|0:" + ARQUIVO[:mon.FP_BLOCO]).hexdigest()
+    assert fp == f"{mon.FP_VERSAO}:{h}"
+    assert len(sessao.pedidos) == 1
+
+
+# ====== URL CANÔNICA ======
+DOC = "http://www.bcb.gov.br/content/estabilidadefinanceira/leiautes/atual/Relat%C3%B3rio%20Di%C3%A1rio.pdf"
+
+def _mesma_chave(*urls):
+    return len({mon.canonizar_url(u) for u in urls}) == 1
+
+def test_canonica_caixa_do_esquema_e_do_host():
+    assert _mesma_chave(DOC, DOC.replace("http://www.bcb.gov.br", "HTTP://WWW.BCB.Gov.BR"))
+    # o caminho diferencia maiúsculas: outro arquivo no servidor
+    assert not _mesma_chave(DOC, DOC.replace("/atual/", "/ATUAL/"))
+
+def test_canonica_percent_encoding():
+    assert _mesma_chave(
+        DOC,
+        DOC.replace("%C3%B3", "%c3%b3").replace("%C3%A1", "%c3%a1"),            # hex minúsculo
+        DOC.replace("%C3%B3", "ó").replace("%C3%A1", "á").replace("%20", " "),  # acento e espaço crus
+        DOC.replace("%C3%B3", "%F3").replace("%C3%A1", "%E1"),                  # latin-1
+    )
+    assert not _mesma_chave(DOC, DOC.replace("Relat%C3%B3rio", "Relatorio"))
+
+def test_canonica_barra_no_fim():
+    assert _mesma_chave("http://www.bcb.gov.br", "http://www.bcb.gov.br/")
+    assert _mesma_chave(DOC, DOC.replace("/atual/", "//atual//"))
+    # barra no fim de um arquivo é outro recurso, não uma grafia do mesmo
+    assert not _mesma_chave(DOC, DOC + "/")
+
+def test_canonica_fragmento_porta_e_query():
+    assert _mesma_chave(DOC, DOC + "#page=2", DOC + "#")
+    assert _mesma_chave(DOC, DOC.replace("www.bcb.gov.br", "www.bcb.gov.br:80"))
+    assert _mesma_chave(DOC.replace("http:", "https:"), DOC.replace("http://www.bcb.gov.br", "https://www.bcb.gov.br:443"))
+    assert not _mesma_chave(DOC, DOC.replace("www.bcb.gov.br", "www.bcb.gov.br:8080"))
+    assert not _mesma_chave(DOC, DOC.replace("http:", "https:"))
+    assert _mesma_chave(DOC + "?v=%C3%A9", DOC + "?v=é")
+    assert not _mesma_chave(DOC + "?v=1", DOC + "?v=2")
+
+def test_indice_leva_as_grafias_para_a_chave_do_manifest():
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = mon._manifest_db(Path(tmp) / "manifest.sqlite3")
+        try:
+            indice = mon.IndiceUrls(conn, {DOC: {}})
+            for grafia in (DOC.replace("%C3%B3", "ó").replace("%C3%A1", "á").replace("%20", " "),
+                           DOC.replace("http://www.bcb.gov.br", "HTTP://WWW.BCB.GOV.BR:80") + "#p2",
+                           DOC.replace("%C3%B3", "%c3%b3")):
+                assert indice.documento(grafia) == DOC, grafia
+
+            # documento novo fica com a primeira grafia vista; as seguintes caem nela
+            novo = "http://www.bcb.gov.br/atual/Nova%20Vers%C3%A3o.xsd"
+            assert indice.documento(" " + novo + " ") == novo
+            assert indice.documento(novo.replace("%C3%A3", "%E3") + "#x") == novo
+            assert indice.documento(DOC + "/") == DOC + "/"
+
+            # alias gravado (ex.: link que redireciona para o documento) vale na próxima execução
+            alias = "http://www.bcb.gov.br/htms/leiaute_relatorio.pdf"
+            mon._manifest_gravar_alias(conn, alias, DOC, "redirect")
+            indice = mon.IndiceUrls(conn, {DOC: {}})
+            assert indice.documento(alias) == DOC
+            assert indice.documento("HTTP://WWW.BCB.GOV.BR/htms/leiaute_relatorio.pdf#topo") == DOC
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    falhas = 0
+    for nome, func in list(globals().items()):
+        if nome.startswith("test_") and callable(func):
+            try:
+                func()
+                print(f"ok     {nome}")
+            except Exception as e:
+                falhas += 1
+                print(f"FALHOU {nome}: {type(e).__name__}: {e}")
+    sys.exit(1 if falhas else 0)
@@ -1,6 +1,7 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
+T0_NS=$(date +%s%N)
 SITE_HOME="/home/tsalachtech.com.br"
 APP_DIR="$SITE_HOME/apps/leiautes"
 PUBLIC_DIR="$SITE_HOME/public_html/monitoramentos/leiautes"
@@ -12,7 +13,8 @@ REQ="$APP_DIR/requirements.txt"
 MAIN=$(ls -1 "$APP_DIR/scripts/"*.py 2>/dev/null | head -n1)
 
 mkdir -p "$LOG_DIR"; touch "$TAIL"; chmod 664 "$TAIL"
-log(){ echo "$(date '+%F %T') | $1" | tee -a "$LOG_DIR/execucao_$(date '+%Y%m%d').log"; }
+# só stdout (o cron guarda em cron_*.log); o log do monitor é o logs/monitor_leiautes.jsonl
+log(){ echo "$(date '+%F %T') | $1"; }
 tailw(){ echo "$(date '+%d/%m/%Y %H:%M:%S') | $1" > "$TAIL"; }
 
 log "=== INÍCIO leiautes ==="
@@ -24,8 +26,17 @@ if [ ! -x "$PY" ]; then
   "$VENV_DIR/bin/pip" install --upgrade pip
 fi
 
-# requirements (se existir)
-[ -f "$REQ" ] && "$VENV_DIR/bin/pip" install -r "$REQ" -q || true
+# requirements (se existir): só reinstala quando o hash do arquivo muda (FORCE_PIP=1 força)
+REQ_STAMP="$VENV_DIR/.requirements.sha256"
+if [ -f "$REQ" ]; then
+  req_hash=$(sha256sum "$REQ" | cut -d' ' -f1)
+  if [ "${FORCE_PIP:-0}" = "1" ] || [ ! -f "$REQ_STAMP" ] || [ "$(cat "$REQ_STAMP")" != "$req_hash" ]; then
+    log "Instalando dependências (requirements.txt mudou)"
+    if "$VENV_DIR/bin/pip" install -r "$REQ" -q; then
+      echo "$req_hash" > "$REQ_STAMP"
+    fi
+  fi
+fi
 
 # checagens mínimas
 if [ -z "$MAIN" ]; then
@@ -34,10 +45,11 @@ if [ -z "$MAIN" ]; then
   exit 2
 fi
 
-# executa
+# executa (MONITOR_T0_NS: o script loga quanto tempo levou do run.sh até o main);
+# argumentos são repassados ao script, ex.: run.sh --projetos
 set +e
 cd "$APP_DIR"
-"$PY" "$MAIN"
+MONITOR_T0_NS="$T0_NS" "$PY" "$MAIN" "$@"
 rc=$?
 set -e
 
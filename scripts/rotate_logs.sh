@@ -1,8 +1,14 @@
 #!/bin/bash
+# O log do monitor (logs/monitor_leiautes.jsonl) é rotacionado e comprimido pelo
+# próprio script Python; aqui só ficam os logs de texto do cron e os de versões antigas.
 set -euo pipefail
 APP="/home/tsalachtech.com.br/apps/leiautes"
 LOG="$APP/logs"
-find "$LOG" -type f -name "monitor_leiautes_*.log" -mtime +14 -delete 2>/dev/null || true
+DIAS="${LOG_DIAS:-14}"
+# comprime os logs de texto de dias anteriores (cron_*.log, execucao_*.log e monitor_leiautes_*.log antigos)
+find "$LOG" -maxdepth 1 -type f \( -name "cron_*.log" -o -name "execucao_*.log" -o -name "monitor_leiautes_*.log*" \) \
+  ! -name "*.gz" ! -newermt "$(date +%F)" -exec gzip -9 -q {} \; 2>/dev/null || true
+find "$LOG" -maxdepth 1 -type f -name "*.log*.gz" -mtime +"$DIAS" -delete 2>/dev/null || true
 if [ -f "$LOG/execucao_cron.log" ]; then
   s=$(stat -c%s "$LOG/execucao_cron.log" 2>/dev/null || echo 0)
   if [ "$s" -gt 5242880 ]; then
@@ -7,38 +7,57 @@ Monitor de leiautes Bacen (v3.2a+4111)
 - Playwright com flags para ambiente compartilhado
 - **NOVO**: Envia e-mail mesmo sem novidades (configurável) e deixa o texto de "Não há documentos" alinhado à esquerda e na cor azul do logotipo (#2e3192)
 - **NOVO**: Suporte ao Documento 4111 (Saldos Contábeis Diários - SCD)
+- Um único Chromium por execução, com as páginas carregadas em paralelo
+- Extração pelo HTML estático (requests + html.parser); Chromium só como fallback
+- Manifest em SQLite (scripts/manifest.sqlite3) com histórico de mudanças
+- Modo daemon (--daemon) com intervalos de checagem adaptativos por página/anexo
+- Partida rápida: imports pesados e logging só quando usados, tempo de inicialização no log
+- Métricas por etapa/URL em logs/metricas/*.json, <proj>.prom (Prometheus) e no _status_tail
+- Leitura de cada página guiada por ESPECS_PAGINAS, com um único page.evaluate por página
+- Carregamento enxuto no Chromium: sem imagens/mídia/fontes/rastreadores, espera só a região da espec
+- Vários projetos num só processo (--projetos), com Chromium, sessão HTTP e SMTP compartilhados
+- Prazo total da execução, limite de requisições e pausa por host; execução parcial explicada no tail
+- Log em fila (thread própria) no formato JSON-lines, com rotação/gzip embutidas e consulta às execuções
+- Snapshots das páginas lidas (runtime/snapshots, com TTL) e modo replay (--replay), só de leitura
+- Páginas, checagem e download dos anexos em fluxo (PipelineAnexos), com o mesmo resultado da execução em fases
+- URL canônica e tabela de aliases no manifest: cada documento checado uma vez, com as categorias unidas
+- Diário da execução com checkpoints (páginas, anexos, downloads, e-mail): execução interrompida é retomada
+- Chromium persistente opcional (CDP + perfil com cache em disco) compartilhado entre as execuções, com health check
+- Anexos do e-mail compactados em ZIP (em partes, se preciso); o que não couber segue só pelo link
 """
 
+import time
+_T_INICIO = time.perf_counter()
+
 from datetime import datetime, timedelta
 from pathlib import Path
-from playwright.sync_api import sync_playwright
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.image import MIMEImage
-from email.mime.base import MIMEBase
-from email.utils import make_msgid
-from email import encoders
 
-import ssl, smtplib, os, re, json, hashlib, requests, sys, mimetypes, traceback
-from urllib.parse import urlparse, unquote
+# Playwright, smtplib e email.* são importados só nas etapas que os usam
+import os, re, json, hashlib, requests, sys, mimetypes, traceback, sqlite3, argparse
+import asyncio, threading, base64, tempfile, uuid
+from urllib.parse import urlparse, unquote, urljoin, urlsplit, urlunsplit, quote, unquote_to_bytes
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 
 # >>> ajuste este caminho por projeto
 TAIL_PATH_BASE = "/home/tsalachtech.com.br/public_html/monitoramentos/leiautes/_status_tail.txt"
-LOG_PATH_BASE  = "/home/tsalachtech.com.br/apps/leiautes/logs/execucao_{data}.log"
+LOG_PATH_BASE  = "/home/tsalachtech.com.br/apps/leiautes/logs/monitor_leiautes.jsonl"
 
 
 def _write_status_tail(proj: str,
                        header_status: str,
                        resumo: dict,
                        ultimos: list[str] | None = None,
-                       extra_info: str | None = None) -> None:
+                       extra_info: str | None = None,
+                       quando: datetime | None = None) -> None:
     status_code = 0
     if "AVISO" in header_status:
         status_code = 1
     elif "ERRO" in header_status:
         status_code = 2
 
-    now = datetime.now()
+    now = quando or datetime.now()
     now_fmt = now.strftime('%d/%m/%Y %H:%M:%S')
     tail_path = TAIL_PATH_BASE.format(proj=proj)
     log_path  = LOG_PATH_BASE.format(proj=proj, data=now.strftime("%Y%m%d"))
@@ -82,22 +101,256 @@ READ_TIMEOUT = 10
 TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
 
 # ====== LOGGING ======
+# O monitor só enfileira os registros (QueueHandler); uma thread (QueueListener)
+# grava em logs/monitor_leiautes.jsonl, um evento JSON por linha, e ecoa no stdout.
+# O arquivo é rotacionado por tamanho ou na virada do dia, e as cópias antigas
+# (.1.gz, .2.gz...) são comprimidas pela própria thread, fora do caminho da execução.
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 LOG_DIR = BASE / "logs"
-LOG_DIR.mkdir(exist_ok=True)
-LOG_FILE = LOG_DIR / f"monitor_leiautes_{datetime.now():%Y%m%d}.log"
+LOG_FILE = LOG_DIR / "monitor_leiautes.jsonl"
+LOG_MAX_BYTES = int(float(os.environ.get("MONITOR_LOG_MAX_MB", "5")) * 1024 * 1024)
+LOG_BACKUPS = int(os.environ.get("MONITOR_LOG_BACKUPS", "30"))
 
 logger = logging.getLogger("monitor_leiautes")
 logger.setLevel(logging.INFO)
-if not logger.handlers:
-    fh = RotatingFileHandler(LOG_FILE, maxBytes=1_000_000, backupCount=7, encoding="utf-8")
-    fh.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+_log_listener = None
+
+EXECUCAO_ID = None       # id da execução em andamento, gravado em todo evento
+PROJETO_ATUAL = "leiautes"
+
+class _ContextoExecucao(logging.Filter):
+    """Anota execução e projeto no registro, ainda na thread que logou."""
+    def filter(self, record):
+        record.execucao = EXECUCAO_ID
+        record.proj = PROJETO_ATUAL
+        return True
+
+class _FormatadorJSON(logging.Formatter):
+    def format(self, record):
+        evento = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "execucao": getattr(record, "execucao", None),
+            "proj": getattr(record, "proj", None),
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "evento", None):
+            evento["evento"] = record.evento
+            evento["dados"] = getattr(record, "dados", {})
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+def _comprimir_log(origem, destino):
+    import gzip, shutil
+    with open(origem, "rb") as f_in, gzip.open(destino, "wb", compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(origem)
+
+class _RotacaoJSONL(RotatingFileHandler):
+    """RotatingFileHandler que também vira o arquivo na troca de dia e comprime as cópias."""
+
+    def __init__(self, caminho, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        super().__init__(caminho, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        self.namer = lambda nome: nome + ".gz"
+        self.rotator = _comprimir_log
+        try:
+            self._dia = datetime.fromtimestamp(os.path.getmtime(self.baseFilename)).date()
+        except OSError:
+            self._dia = datetime.now().date()
+
+    def shouldRollover(self, record):
+        dia = datetime.fromtimestamp(record.created).date()
+        if dia != self._dia:
+            self._dia = dia
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+        return super().shouldRollover(record)
+
+def _configurar_logging():
+    """Handlers (e a pasta logs/) só são criados por quem realmente executa o monitor."""
+    global _log_listener
+    if logger.handlers:
+        return
+    import atexit, queue
+    LOG_DIR.mkdir(exist_ok=True)
+    fh = _RotacaoJSONL(LOG_FILE)
+    fh.setFormatter(_FormatadorJSON())
     sh = logging.StreamHandler(sys.stdout)
     sh.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-    logger.addHandler(fh)
-    logger.addHandler(sh)
+    fila = queue.SimpleQueue()
+    qh = QueueHandler(fila)
+    qh.addFilter(_ContextoExecucao())
+    logger.addHandler(qh)
+    _log_listener = QueueListener(fila, fh, sh)
+    _log_listener.start()
+    atexit.register(_encerrar_logging)
+
+def _encerrar_logging():
+    """Esvazia a fila e fecha o arquivo; chamado no fim do processo."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        for h in _log_listener.handlers:
+            h.close()
+        _log_listener = None
+
+def _evento(nome, msg, nivel=logging.INFO, **dados):
+    """Registro estruturado: vai para o JSONL com "evento" e "dados" além da mensagem."""
+    logger.log(nivel, msg, extra={"evento": nome, "dados": dados})
+
+def _nova_execucao(**dados):
+    global EXECUCAO_ID
+    EXECUCAO_ID = uuid.uuid4().hex[:12]
+    _evento("execucao_inicio", f"Execução {EXECUCAO_ID} iniciada", **dados)
+
+def _ler_eventos(caminho=None):
+    """Eventos do log, do mais recente ao mais antigo (arquivo atual, depois .1.gz, .2.gz...)."""
+    import gzip
+    caminho = Path(caminho or LOG_FILE)
+    arquivos = [caminho] + [Path(f"{caminho}.{i}.gz") for i in range(1, LOG_BACKUPS + 1)]
+    for arq in arquivos:
+        if not arq.exists():
+            continue
+        abrir = gzip.open if arq.suffix == ".gz" else open
+        try:
+            with abrir(arq, "rt", encoding="utf-8", errors="replace") as f:
+                linhas = f.readlines()
+        except (OSError, EOFError):
+            continue
+        for linha in reversed(linhas):
+            try:
+                yield json.loads(linha)
+            except ValueError:
+                continue  # linha cortada (processo morto no meio da escrita)
+
+def consultar_execucoes(n=10, proj=None, caminho=None):
+    """Últimas `n` execuções concluídas ou com falha (eventos execucao_fim/execucao_falha)."""
+    execucoes = []
+    for ev in _ler_eventos(caminho):
+        if ev.get("evento") not in ("execucao_fim", "execucao_falha"):
+            continue
+        if proj and ev.get("proj") != proj:
+            continue
+        execucoes.append(ev)
+        if len(execucoes) >= n:
+            break
+    return execucoes
+
+# ====== MÉTRICAS ======
+# Tempo por etapa e por URL (spans) e contadores de uma execução. Ao final vão para
+# logs/metricas/<proj>_<data>.json, para <proj>.prom ao lado do _status_tail (formato
+# textfile do node_exporter) e para um resumo no próprio tail.
+METRICAS_DIR = LOG_DIR / "metricas"
+METRICAS_MANTER = 500  # arquivos JSON guardados por projeto
+
+class Metricas:
+    """Spans e contadores de uma execução; pode ser usada por várias threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.inicio = datetime.now()
+            self._t0 = time.perf_counter()
+            self.etapas = {}       # etapa -> {"n", "total_s", "max_s", "erros"}
+            self.spans_url = []    # {"etapa", "url", "s", "erro"}
+            self.contadores = {}
+
+    def contar(self, nome, n=1):
+        with self._lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + n
+
+    def registrar(self, etapa, segundos, url=None, erro=None):
+        with self._lock:
+            e = self.etapas.setdefault(etapa, {"n": 0, "total_s": 0.0, "max_s": 0.0, "erros": 0})
+            e["n"] += 1
+            e["total_s"] += segundos
+            e["max_s"] = max(e["max_s"], segundos)
+            if erro:
+                e["erros"] += 1
+            if url is not None:
+                self.spans_url.append({"etapa": etapa, "url": url, "s": round(segundos, 4), "erro": erro})
+
+    @contextmanager
+    def span(self, etapa, url=None):
+        t0, erro = time.perf_counter(), None
+        try:
+            yield
+        except BaseException as e:
+            erro = type(e).__name__
+            raise
+        finally:
+            self.registrar(etapa, time.perf_counter() - t0, url, erro)
+
+    def como_dict(self, **extra):
+        with self._lock:
+            return {
+                "inicio": self.inicio.isoformat(timespec="seconds"),
+                "duracao_s": round(time.perf_counter() - self._t0, 4),
+                **extra,
+                "etapas": {k: {**v, "total_s": round(v["total_s"], 4), "max_s": round(v["max_s"], 4)}
+                           for k, v in self.etapas.items()},
+                "contadores": dict(self.contadores),
+                "urls": list(self.spans_url),
+            }
+
+    def resumo(self):
+        """Uma linha para o tail: tempo das etapas principais e volumes."""
+        nomes = [("paginas", "páginas"), ("checagem_anexos", "checagem"), ("downloads", "downloads"),
+                 ("montagem_email", "montagem"), ("envio_smtp", "SMTP")]
+        with self._lock:
+            tempos = [f"{rot} {self.etapas[k]['total_s']:.1f}s" for k, rot in nomes if k in self.etapas]
+            c = dict(self.contadores)
+        volumes = [f"{c.get('anexos_checados', 0)} anexos checados",
+                   f"{c.get('downloads', 0)} baixados ({c.get('bytes_baixados', 0) / 1e6:.1f} MB)",
+                   f"{c.get('smtp_novas_tentativas', 0)} novas tentativas SMTP"]
+        return " · ".join(tempos) + (" | " if tempos else "") + ", ".join(volumes)
+
+    def gravar(self, proj="leiautes", sucesso=True):
+        """Grava o JSON da execução e o textfile do Prometheus; falhas só vão para o log."""
+        dados = self.como_dict(projeto=proj, sucesso=sucesso)
+        try:
+            METRICAS_DIR.mkdir(parents=True, exist_ok=True)
+            (METRICAS_DIR / f"{proj}_{self.inicio:%Y%m%d_%H%M%S}.json").write_text(
+                json.dumps(dados, ensure_ascii=False, indent=1), encoding="utf-8")
+            antigos = sorted(METRICAS_DIR.glob(f"{proj}_*.json"))[:-METRICAS_MANTER]
+            for arq in antigos:
+                arq.unlink(missing_ok=True)
+        except Exception as e:
+            logger.warning(f"Falha ao gravar métricas em JSON: {e}")
+        try:
+            _gravar_prometheus(Path(TAIL_PATH_BASE.format(proj=proj)).with_name(f"{proj}.prom"), dados)
+        except Exception as e:
+            logger.warning(f"Falha ao gravar métricas do Prometheus: {e}")
+
+def _gravar_prometheus(caminho, dados):
+    """Textfile do node_exporter: escrito num temporário e renomeado (o coletor nunca lê pela metade)."""
+    rotulo = f'projeto="{dados["projeto"]}"'
+    linhas = [
+        "# TYPE monitor_leiautes_execucao_sucesso gauge",
+        f"monitor_leiautes_execucao_sucesso{{{rotulo}}} {int(dados['sucesso'])}",
+        "# TYPE monitor_leiautes_execucao_duracao_segundos gauge",
+        f"monitor_leiautes_execucao_duracao_segundos{{{rotulo}}} {dados['duracao_s']}",
+        "# TYPE monitor_leiautes_execucao_timestamp_segundos gauge",
+        f"monitor_leiautes_execucao_timestamp_segundos{{{rotulo}}} {int(time.time())}",
+        "# TYPE monitor_leiautes_etapa_segundos gauge",
+    ]
+    linhas += [f'monitor_leiautes_etapa_segundos{{{rotulo},etapa="{k}"}} {v["total_s"]}'
+               for k, v in dados["etapas"].items()]
+    linhas.append("# TYPE monitor_leiautes_etapa_execucoes gauge")
+    linhas += [f'monitor_leiautes_etapa_execucoes{{{rotulo},etapa="{k}"}} {v["n"]}'
+               for k, v in dados["etapas"].items()]
+    linhas.append("# TYPE monitor_leiautes_contador gauge")
+    linhas += [f'monitor_leiautes_contador{{{rotulo},nome="{k}"}} {v}'
+               for k, v in sorted(dados["contadores"].items())]
+    tmp = caminho.with_name(caminho.name + ".tmp")
+    tmp.write_text("\n".join(linhas) + "\n", encoding="utf-8")
+    os.replace(tmp, caminho)
+
+metricas = Metricas()
 
 # ====== AJUSTES ======
 QUIET_BASELINE = False
@@ -109,8 +362,34 @@ MAX_ATTACHMENTS = 8
 MAX_SINGLE_ATTACH_SIZE = 4 * 1024 * 1024
 MAX_TOTAL_ATTACH_SIZE = 18 * 1024 * 1024
 
+# Anexos compactados em ZIP: cada parte até MAX_SINGLE_ATTACH_SIZE e o conjunto até
+# MAX_TOTAL_ATTACH_SIZE, já comprimidos; o que não couber segue só como link. Com a
+# compactação, o download aceita arquivos maiores (MONITOR_MAX_DOWNLOAD_MB).
+COMPACTAR_ANEXOS = os.environ.get("MONITOR_COMPACTAR_ANEXOS", "1") != "0"
+MAX_DOWNLOAD_ANEXO = int(float(os.environ.get("MONITOR_MAX_DOWNLOAD_MB", "50")) * 1024 * 1024)
+
 SEND_EMAIL_WHEN_NO_CHANGES = True
 
+# Quantas páginas o Chromium compartilhado carrega ao mesmo tempo
+MAX_PAGINAS_SIMULTANEAS = int(os.environ.get("MONITOR_MAX_PAGINAS", "4"))
+
+# Extração das páginas: "auto" (HTML estático via requests, Chromium só se a
+# página vier sem tabela/anexos), "http" (nunca abre o navegador), "playwright"
+# ou "replay" (só os snapshots gravados em runtime/snapshots; os anexos não são
+# consultados e a execução não grava o manifest nem manda e-mail)
+MODO_EXTRACAO = os.environ.get("MONITOR_MODO_EXTRACAO", "auto")
+
+# Snapshots das páginas lidas (HTML comprimido), válidos por SNAPSHOT_TTL_H horas
+GRAVAR_SNAPSHOTS = os.environ.get("MONITOR_SNAPSHOTS", "1") != "0"
+SNAPSHOT_TTL_H = float(os.environ.get("MONITOR_SNAPSHOT_TTL_H", "72"))
+
+# Checagem dos anexos (HEAD/Range) em paralelo, com teto por host e prazo total
+MAX_VERIFICACOES_SIMULTANEAS = int(os.environ.get("MONITOR_MAX_VERIFICACOES", "8"))
+MAX_VERIFICACOES_POR_HOST = int(os.environ.get("MONITOR_MAX_POR_HOST", "4"))
+PRAZO_VERIFICACAO_ANEXOS = float(os.environ.get("MONITOR_PRAZO_ANEXOS_S", "180"))
+# Downloads antecipados (anexo alterado já baixado enquanto o resto é checado)
+MAX_DOWNLOADS_SIMULTANEOS = int(os.environ.get("MONITOR_MAX_DOWNLOADS", "2"))
+
 # ====== PÁGINAS A MONITORAR ======
 urls = [
     "https://www.bcb.gov.br/estabilidadefinanceira/leiautedocumentoDDR2011",
@@ -121,32 +400,580 @@ urls = [
     "https://www.bcb.gov.br/estabilidadefinanceira/leiautedocumentoscrd",  # 4111 - SCD
 ]
 
+# Como ler cada página. A chave é um trecho da URL (em minúsculas); o que não casar
+# com nenhuma usa ESPEC_PADRAO. A mesma especificação vale para o Chromium e para o
+# HTML estático:
+# - linha: só os links das linhas <tr> cujo texto contém este trecho (None = página toda)
+# - datas: coleta as células <td> no formato dd/mm/aaaa
+# - anexo: regex que a URL absoluta do link deve casar (sintaxe comum a Python e JavaScript)
+# - filtrar: aplica ONLY_ATUAL/EXCLUDE_PATTERNS
+# - categoria: categoria dos anexos no e-mail
+# - pronto: seletor (Playwright) da região que precisa estar montada para a leitura
+ESPEC_PADRAO = {
+    "linha": None,
+    "datas": True,
+    "anexo": r"\.(pdf|xlsx?|xsd|zip)$",
+    "filtrar": True,
+    "categoria": "Sem categoria",
+    "pronto": "table a[href]",
+}
+ESPECS_PAGINAS = {
+    "leiautedocumentoscrd": {"linha": "4111", "datas": False, "anexo": r"\.(pdf|xsd)",
+                             "filtrar": False, "categoria": "4111 - SCD",
+                             "pronto": "tr:has-text('4111') a[href]"},
+}
+
+def espec_da_pagina(url):
+    u = url.lower()
+    for trecho, espec in ESPECS_PAGINAS.items():
+        if trecho in u:
+            return {**ESPEC_PADRAO, **espec}
+    return dict(ESPEC_PADRAO)
+
+# Incrementar quando a lógica de extração mudar (_ExtratorHTML, JS_EXTRAIR_PAGINA,
+# _resultado_por_espec): o resultado guardado no cache de páginas deixa de valer
+VERSAO_EXTRACAO = 1
+
+def versao_extracao(espec):
+    """Espec da página + filtros + versão do extrator; o cache só vale com a mesma."""
+    chave = json.dumps([VERSAO_EXTRACAO, espec, ONLY_ATUAL, EXCLUDE_PATTERNS], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(chave.encode("utf-8")).hexdigest()[:16]
+
 # ====== DATA DE REFERÊNCIA ======
-hoje = datetime.now().strftime("%d/%m/%Y")
-ASSUNTO = f"📢 Atenção: Atualização na página de Leiautes do Bacen na data: {hoje}"
+def _atualizar_data_referencia():
+    """Recalcula `hoje`/ASSUNTO (o modo daemon atravessa a meia-noite)."""
+    global hoje, ASSUNTO
+    hoje = os.environ.get("MONITOR_TEST_DATE") or datetime.now().strftime("%d/%m/%Y")
+    ASSUNTO = f"📢 Atenção: Atualização na página de Leiautes do Bacen na data: {hoje}"
+
+_atualizar_data_referencia()
 
 # ====== MANIFEST ======
+# Estado atual dos anexos + histórico de mudanças em SQLite (stdlib). O JSON antigo
+# (MANIFEST_PATH) é importado automaticamente na primeira abertura do banco.
 MANIFEST_PATH = SCRIPT_DIR / "manifest_arquivos.json"
+MANIFEST_DB_PATH = SCRIPT_DIR / "manifest.sqlite3"
+
+_CAMPOS_MANIFEST = ("etag", "last_modified", "content_length", "final_url", "partial_fp", "checked_at", "error",
+                    "sha256")
+
+_SCHEMA_MANIFEST = """
+CREATE TABLE IF NOT EXISTS anexos (
+    url            TEXT PRIMARY KEY,
+    etag           TEXT,
+    last_modified  TEXT,
+    content_length TEXT,
+    final_url      TEXT,
+    partial_fp     TEXT,
+    checked_at     TEXT,
+    error          TEXT,
+    sha256         TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_anexos_final_url ON anexos(final_url);
+CREATE TABLE IF NOT EXISTS historico (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    url            TEXT NOT NULL,
+    observado_em   TEXT NOT NULL,
+    evidencia      TEXT,
+    etag           TEXT,
+    last_modified  TEXT,
+    content_length TEXT,
+    final_url      TEXT,
+    partial_fp     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_historico_url ON historico(url, observado_em);
+CREATE TABLE IF NOT EXISTS paginas (
+    url   TEXT PRIMARY KEY,
+    dados TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    alias    TEXT PRIMARY KEY,
+    url      TEXT NOT NULL,
+    motivo   TEXT,
+    visto_em TEXT
+);
+CREATE TABLE IF NOT EXISTS diario_execucao (
+    execucao    TEXT PRIMARY KEY,
+    data_ref    TEXT NOT NULL,
+    iniciada_em TEXT NOT NULL,
+    estado      TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS diario (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    execucao   TEXT NOT NULL,
+    etapa      TEXT NOT NULL,
+    chave      TEXT NOT NULL,
+    dados      TEXT,
+    gravado_em TEXT NOT NULL,
+    UNIQUE (execucao, etapa, chave)
+);
+"""
 
-def _load_manifest():
-    if MANIFEST_PATH.exists():
+def _manifest_db(path=None, compartilhada=False):
+    path = Path(path or MANIFEST_DB_PATH)
+    novo = not path.exists()
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=not compartilhada)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA_MANIFEST)
+    colunas = {row["name"] for row in conn.execute("PRAGMA table_info(anexos)")}
+    for campo in _CAMPOS_MANIFEST:
+        if campo not in colunas:
+            conn.execute(f"ALTER TABLE anexos ADD COLUMN {campo} TEXT")
+    if novo and MANIFEST_PATH.exists():
         try:
-            return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+            n = importar_manifest_json(MANIFEST_PATH, conn)
+            logger.info(f"Manifest JSON importado para o SQLite: {n} anexo(s) de {MANIFEST_PATH.name}")
         except Exception as e:
-            logger.warning(f"Falha ao ler manifest: {e}")
-    return {}
+            logger.warning(f"Falha ao importar {MANIFEST_PATH}: {e}")
+    return conn
+
+def _load_manifest(conn=None):
+    fechar = conn is None
+    conn = conn or _manifest_db()
+    try:
+        manifest = {}
+        for row in conn.execute("SELECT * FROM anexos"):
+            entrada = {k: row[k] for k in _CAMPOS_MANIFEST}
+            for opcional in ("error", "sha256"):
+                if entrada[opcional] is None:
+                    entrada.pop(opcional)
+            manifest[row["url"]] = entrada
+        return manifest
+    finally:
+        if fechar: conn.close()
+
+def _manifest_gravar(conn, url, entrada, evidencia=None, diario=None, checkpoints=()):
+    """
+    Grava o estado atual de um anexo (e, se houve mudança, uma linha no histórico) numa
+    transação; os `checkpoints` (etapa, chave, dados) do diário entram na mesma transação.
+    """
+    valores = [entrada.get(k) for k in _CAMPOS_MANIFEST]
+    with conn:
+        for etapa, chave, dados in checkpoints:
+            diario.gravar_em(conn, etapa, chave, dados)
+        conn.execute(
+            f"INSERT OR REPLACE INTO anexos (url, {', '.join(_CAMPOS_MANIFEST)}) "
+            f"VALUES (?{', ?' * len(_CAMPOS_MANIFEST)})", [url, *valores])
+        if evidencia is not None:
+            conn.execute(
+                "INSERT INTO historico (url, observado_em, evidencia, etag, last_modified, "
+                "content_length, final_url, partial_fp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [url, entrada.get("checked_at") or datetime.now().isoformat(), evidencia,
+                 entrada.get("etag"), entrada.get("last_modified"), entrada.get("content_length"),
+                 entrada.get("final_url"), entrada.get("partial_fp")])
+
+def _manifest_registrar_sha(conn, url, sha256):
+    """Guarda o hash real do conteúdo baixado; devolve o hash anterior (ou None)."""
+    row = conn.execute("SELECT sha256 FROM anexos WHERE url = ?", (url,)).fetchone()
+    with conn:
+        conn.execute("UPDATE anexos SET sha256 = ? WHERE url = ?", (sha256, url))
+    return row["sha256"] if row else None
+
+def _save_manifest(data, conn=None):
+    """Grava um manifest inteiro ({url: entrada}); não sobrescreve entradas mais novas."""
+    fechar = conn is None
+    conn = conn or _manifest_db()
+    try:
+        with conn:
+            conn.executemany(
+                f"INSERT INTO anexos (url, {', '.join(_CAMPOS_MANIFEST)}) VALUES (?{', ?' * len(_CAMPOS_MANIFEST)}) "
+                f"ON CONFLICT(url) DO UPDATE SET {', '.join(f'{k} = excluded.{k}' for k in _CAMPOS_MANIFEST)} "
+                f"WHERE anexos.checked_at IS NULL OR excluded.checked_at >= anexos.checked_at",
+                [[url, *[(entrada or {}).get(k) for k in _CAMPOS_MANIFEST]] for url, entrada in data.items()])
+    finally:
+        if fechar: conn.close()
+
+def importar_manifest_json(path, conn=None):
+    """Importa um manifest no formato JSON antigo (ex.: manifest_arquivos_4111.json)."""
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    _save_manifest(data, conn)
+    return len(data)
+
+# URL canônica e aliases: o mesmo documento aparece com grafias diferentes (acento
+# cru ou %-codificado, %c3%a9 x %C3%A9, host em maiúsculas, porta padrão) ou por
+# links diferentes que redirecionam para o mesmo arquivo. Cada grafia é levada à
+# chave do documento no manifest, então ele é checado uma vez por execução. A forma
+# canônica só serve de chave de comparação: o que é requisitado, gravado e enviado
+# no e-mail é sempre uma grafia vista na página (%2F, // e %E9 podem importar ao servidor).
+_PORTAS_PADRAO = {"http": 80, "https": 443}
+
+def _recodificar(parte, seguros):
+    bruto = unquote_to_bytes(parte)
+    try:
+        texto = bruto.decode("utf-8")
+    except UnicodeDecodeError:
+        texto = bruto.decode("latin-1")  # %E9 (latin-1) e %C3%A9 (UTF-8) são o mesmo "é"
+    return quote(texto, safe=seguros)
+
+def canonizar_url(url):
+    """
+    Chave de comparação de uma URL: esquema/host em minúsculas, sem porta padrão nem
+    fragmento, %-codificação única. Não é uma URL para requisitar.
+    """
+    sp = urlsplit(url.strip())
+    esquema = sp.scheme.lower()
+    host = (sp.hostname or "").lower()
+    if sp.port and sp.port != _PORTAS_PADRAO.get(esquema):
+        host = f"{host}:{sp.port}"
+    caminho = re.sub(r"/{2,}", "/", _recodificar(sp.path, "/:@!$&'()*+,;=~")) or "/"
+    query = _recodificar(sp.query, "/:@!$&'()*+,;=?~")
+    return urlunsplit((esquema, host, caminho, query, ""))
+
+class IndiceUrls:
+    """Resolve qualquer grafia de um anexo para a chave do documento no manifest."""
+
+    def __init__(self, conn, manifest):
+        self._por_canonica = {}
+        for url in manifest:
+            self._por_canonica.setdefault(canonizar_url(url), url)
+        self._aliases = {row["alias"]: row["url"] for row in conn.execute("SELECT alias, url FROM aliases")}
+
+    def documento(self, url):
+        """Chave no manifest; um documento novo fica com a primeira grafia vista."""
+        canonica = canonizar_url(url)
+        return (self._aliases.get(canonica) or self._por_canonica.get(canonica)
+                or self._por_canonica.setdefault(canonica, url.strip()))
+
+def _manifest_gravar_alias(conn, alias, url, motivo):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO aliases (alias, url, motivo, visto_em) VALUES (?, ?, ?, ?)",
+                     (canonizar_url(alias), url, motivo, datetime.now().isoformat()))
+
+# Validadores (ETag/Last-Modified), fingerprint e último resultado de cada página monitorada
+def _load_paginas_cache():
+    conn = _manifest_db()
+    try:
+        return {row["url"]: json.loads(row["dados"]) for row in conn.execute("SELECT url, dados FROM paginas")}
+    except Exception as e:
+        logger.warning(f"Falha ao ler cache de páginas: {e}")
+        return {}
+    finally:
+        conn.close()
+
+def _save_paginas_cache(data):
+    conn = _manifest_db()
+    try:
+        with conn:
+            conn.execute("DELETE FROM paginas")
+            conn.executemany("INSERT INTO paginas (url, dados) VALUES (?, ?)",
+                             [(url, json.dumps(d, ensure_ascii=False)) for url, d in data.items()])
+    finally:
+        conn.close()
+
+def _hash_normalizado(texto):
+    return hashlib.sha256(" ".join(texto.split()).encode("utf-8")).hexdigest()
 
-def _save_manifest(data):
-    MANIFEST_PATH.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+def _registro_pagina(res, modo, fingerprint, extracao, etag=None, last_modified=None):
+    datas, anexos, categorias = res
+    return {
+        "modo": modo,
+        "fingerprint": fingerprint,
+        "extracao": extracao,
+        "etag": etag,
+        "last_modified": last_modified,
+        "checked_at": datetime.now().isoformat(),
+        "datas": datas,
+        "anexos": anexos,
+        "categorias": categorias,
+    }
+
+def _cache_pagina_vale(anterior, modo, extracao):
+    """Resultado guardado pelo mesmo modo e com a mesma espec/versão do extrator."""
+    return anterior.get("modo") == modo and anterior.get("extracao") == extracao
+
+def _resultado_do_cache(anterior):
+    anterior["checked_at"] = datetime.now().isoformat()
+    return list(anterior["datas"]), list(anterior["anexos"]), dict(anterior["categorias"])
+
+# ====== DIÁRIO DA EXECUÇÃO ======
+# Checkpoints de uma execução no próprio manifest: páginas lidas, anexos checados,
+# anexos alterados, downloads e o e-mail enfileirado. Se a execução cai no meio
+# (Chromium, prazo, SMTP...), a próxima do mesmo dia retoma dali: não relê as
+# páginas nem rechecha os anexos já feitos, e os alterados da tentativa anterior
+# (que o manifest já registra como vistos) continuam indo no e-mail. O diário é
+# encerrado quando o e-mail sai da outbox ou quando não há e-mail a mandar.
+DIARIO_VALIDADE_H = float(os.environ.get("MONITOR_DIARIO_VALIDADE_H", "12"))
+
+class DiarioExecucao:
+    """Diário da execução atual (retomada ou nova); pode ser usado por várias threads."""
+
+    def __init__(self, path=None):
+        self._conn = _manifest_db(path, compartilhada=True)
+        self._lock = threading.Lock()
+        self.id, self.retomada = self._abrir()
+
+    def _abrir(self):
+        ultima = self._conn.execute("SELECT * FROM diario_execucao ORDER BY iniciada_em DESC LIMIT 1").fetchone()
+        if ultima is not None and self._retomavel(ultima):
+            return ultima["execucao"], True
+        # o manifest já marcou como vistos os alterados de uma execução que caiu antes
+        # de pôr o e-mail na outbox: eles passam para a nova, senão nunca são avisados
+        pendentes = self._alterados_nao_enviados(ultima) if ultima is not None else {}
+        execucao = uuid.uuid4().hex[:12]
+        with self._conn:
+            self._conn.execute("DELETE FROM diario")
+            self._conn.execute("DELETE FROM diario_execucao")
+            self._conn.execute("INSERT INTO diario_execucao (execucao, data_ref, iniciada_em, estado) "
+                               "VALUES (?, ?, ?, 'em_andamento')", (execucao, hoje, datetime.now().isoformat()))
+            for url, alterado in pendentes.items():
+                self._conn.execute("INSERT INTO diario (execucao, etapa, chave, dados, gravado_em) "
+                                   "VALUES (?, 'alterado', ?, ?, ?)",
+                                   (execucao, url, json.dumps(alterado, ensure_ascii=False),
+                                    datetime.now().isoformat()))
+        if pendentes:
+            logger.warning(f"{_plural(len(pendentes), 'anexo alterado', 'anexos alterados')} da execução "
+                           f"{ultima['execucao']} ({ultima['data_ref']}) sem e-mail; incluídos nesta execução")
+        return execucao, False
+
+    def _alterados_nao_enviados(self, ultima):
+        """Alterados de uma execução que não chegou a deixar o e-mail na outbox."""
+        if ultima["estado"] == "concluida" or self.entradas("email", ultima["execucao"]):
+            return {}
+        return self.entradas("alterado", ultima["execucao"])
+
+    def _retomavel(self, ultima):
+        idade = datetime.now() - datetime.fromisoformat(ultima["iniciada_em"])
+        if ultima["estado"] == "concluida" or ultima["data_ref"] != hoje \
+                or idade > timedelta(hours=DIARIO_VALIDADE_H):
+            return False
+        if ultima["estado"] == "envio_pendente":
+            email = self.entradas("email", ultima["execucao"]).get("outbox") or {}
+            # já entregue (ou desistido) pela outbox: não há o que retomar
+            return bool(email.get("id_email")) and (OUTBOX_DIR / f"{email['id_email']}.json").exists()
+        return True
+
+    def gravar_em(self, conn, etapa, chave, dados=None):
+        """Checkpoint dentro de uma transação de outra conexão (ex.: junto com o manifest)."""
+        conn.execute("INSERT OR IGNORE INTO diario (execucao, etapa, chave, dados, gravado_em) VALUES (?, ?, ?, ?, ?)",
+                     (self.id, etapa, chave, json.dumps(dados, ensure_ascii=False),
+                      datetime.now().isoformat()))
+
+    def registrar(self, etapa, chave, dados=None):
+        with self._lock, self._conn:
+            self.gravar_em(self._conn, etapa, chave, dados)
+
+    def entradas(self, etapa, execucao=None):
+        """{chave: dados} de uma etapa, na ordem em que foram registradas."""
+        with self._lock:
+            linhas = self._conn.execute("SELECT chave, dados FROM diario WHERE execucao = ? AND etapa = ? ORDER BY seq",
+                                        (execucao or self.id, etapa)).fetchall()
+        return {row["chave"]: json.loads(row["dados"]) for row in linhas}
+
+    def estado(self, estado):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE diario_execucao SET estado = ? WHERE execucao = ?", (estado, self.id))
+
+    def fechar(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+# ====== PRAZO DA EXECUÇÃO E LIMITES POR HOST ======
+# Com o bcb.gov.br degradado, os timeouts de cada requisição somados podiam
+# levar a execução a invadir a do próximo cron. A execução tem um prazo total
+# (o que não couber fica para a próxima, com o motivo no tail), cada host tem um
+# limite de requisições por segundo (token bucket) e, depois de algumas falhas
+# seguidas, o host fica em pausa (circuit breaker) em vez de consumir o prazo.
+PRAZO_EXECUCAO_S = float(os.environ.get("MONITOR_PRAZO_EXECUCAO_S", "600"))
+RESERVA_ENVIO_S = float(os.environ.get("MONITOR_RESERVA_ENVIO_S", "60"))  # para montar/enviar o e-mail
+HOST_REQ_POR_S = float(os.environ.get("MONITOR_HOST_REQ_POR_S", "10"))    # 0 = sem limite
+HOST_RAJADA = 20
+HOST_FALHAS_PARA_PAUSA = 5
+HOST_PAUSA_S = 300
+HOST_TESTE_S = 60  # depois da pausa, quanto a requisição de teste pode levar até outra poder passar
+
+class PrazoEsgotado(Exception):
+    pass
+
+class HostIndisponivel(Exception):
+    pass
+
+class Orcamento:
+    """Prazo da execução e motivos de resultado parcial; sem prazo armado, nada expira."""
+
+    def __init__(self):
+        self.fim = None
+        self.duracao = None
+        self.motivos = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def execucao(self, segundos=None):
+        """Arma o prazo; aninhado (multiprojeto chamando a main) não rearma, só zera os motivos."""
+        self.motivos = []
+        if self.fim is not None:
+            yield self
+            return
+        self.duracao = PRAZO_EXECUCAO_S if segundos is None else segundos
+        self.fim = time.monotonic() + self.duracao
+        try:
+            yield self
+        finally:
+            self.fim = self.duracao = None
+
+    def restante(self, reserva=0.0):
+        if self.fim is None:
+            return float("inf")
+        # a reserva nunca passa de 1/4 do prazo, para um prazo curto não travar tudo
+        return self.fim - min(reserva, self.duracao / 4) - time.monotonic()
+
+    def esgotado(self, reserva=0.0):
+        return self.restante(reserva) <= 0
+
+    def timeout(self, timeout=TIMEOUT, reserva=0.0):
+        """Timeout (conexão, leitura) limitado ao que resta do prazo."""
+        resta = self.restante(reserva)
+        if resta <= 0:
+            raise PrazoEsgotado("prazo da execução esgotado")
+        if timeout is None:
+            return None if resta == float("inf") else resta
+        if isinstance(timeout, tuple):
+            return tuple(min(t, resta) for t in timeout)
+        return min(timeout, resta)
+
+    def registrar_motivo(self, texto):
+        with self._lock:
+            if texto not in self.motivos:
+                self.motivos.append(texto)
+                logger.warning(f"Resultado parcial: {texto}")
+
+orcamento = Orcamento()
+
+class ControleHost:
+    """Token bucket + circuit breaker de um host; compartilhado pelas threads."""
+
+    def __init__(self, host, taxa=None, rajada=HOST_RAJADA):
+        self.host = host
+        self.taxa = HOST_REQ_POR_S if taxa is None else taxa
+        self.rajada = rajada
+        self.tokens = float(rajada)
+        self.ultimo = time.monotonic()
+        self.falhas_seguidas = 0
+        self.pausa_ate = 0.0
+        self.teste_ate = 0.0  # meia-abertura: até quando a requisição de teste em curso tem a vez
+        self._lock = threading.Lock()
+
+    def _checar_pausa(self, agora):
+        if self.pausa_ate > agora:
+            raise HostIndisponivel(f"host {self.host} em pausa após {self.falhas_seguidas} falhas seguidas")
+        if self.pausa_ate and self.teste_ate > agora:
+            raise HostIndisponivel(f"host {self.host} aguardando a requisição de teste depois da pausa")
+
+    def _passar(self, agora):
+        """Pausa vencida: só esta requisição passa (teste) até sucesso() ou falha()."""
+        if self.pausa_ate:
+            self.teste_ate = agora + HOST_TESTE_S
+
+    def verificar(self):
+        with self._lock:
+            agora = time.monotonic()
+            self._checar_pausa(agora)
+            self._passar(agora)
+
+    def liberar(self):
+        """Espera um token (dentro do prazo); falha na hora se o host estiver em pausa."""
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._checar_pausa(agora)
+                if self.taxa <= 0:
+                    self._passar(agora)
+                    return
+                self.tokens = min(self.rajada, self.tokens + (agora - self.ultimo) * self.taxa)
+                self.ultimo = agora
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self._passar(agora)
+                    return
+                espera = (1 - self.tokens) / self.taxa
+            if orcamento.restante() < espera:
+                raise PrazoEsgotado("prazo da execução esgotado")
+            metricas.contar("espera_limite_host")
+            time.sleep(espera)
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas_seguidas = 0
+            self.pausa_ate = self.teste_ate = 0.0
+
+    def falha(self):
+        with self._lock:
+            self.falhas_seguidas += 1
+            self.teste_ate = 0.0
+            if self.falhas_seguidas < HOST_FALHAS_PARA_PAUSA:
+                return
+            self.pausa_ate = time.monotonic() + HOST_PAUSA_S
+        # depois da pausa passa uma única requisição de teste; se falhar, volta à pausa
+        metricas.contar("hosts_em_pausa")
+        orcamento.registrar_motivo(f"{self.host} em pausa após {HOST_FALHAS_PARA_PAUSA} falhas seguidas")
+
+_controles_host = {}
+_controles_lock = threading.Lock()
+
+def controle_host(url):
+    host = (urlsplit(url).hostname or "").lower()
+    with _controles_lock:
+        if host not in _controles_host:
+            _controles_host[host] = ControleHost(host)
+        return _controles_host[host]
+
+class _SessaoControlada(requests.Session):
+    """Session cujas requisições respeitam o prazo da execução e o controle do host."""
+
+    def request(self, method, url, **kwargs):
+        controle = controle_host(url)
+        controle.liberar()
+        kwargs["timeout"] = orcamento.timeout(kwargs.get("timeout", TIMEOUT))
+        try:
+            r = super().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            controle.falha()
+            raise
+        if r.status_code >= 500 or r.status_code == 429:
+            controle.falha()
+        else:
+            controle.sucesso()
+        return r
 
 # ====== REDE ======
 def _session():
-    sess = requests.Session()
+    sess = _SessaoControlada()
     sess.headers.update({"User-Agent": "FINAUD-Monitor/1.0 (+https://local)"})
+    # a mesma sessão é usada pelas threads de checagem: o pool precisa comportá-las
+    adapter = requests.adapters.HTTPAdapter(pool_connections=10,
+                                            pool_maxsize=max(10, MAX_VERIFICACOES_SIMULTANEAS))
+    sess.mount("https://", adapter)
+    sess.mount("http://", adapter)
     return sess
 
-def head_info(session, url):
-    r = session.head(url, allow_redirects=True, timeout=TIMEOUT)
+def _cabecalhos_condicionais(cur):
+    headers = {}
+    if cur and cur.get("etag"):
+        headers["If-None-Match"] = cur["etag"]
+    if cur and cur.get("last_modified"):
+        headers["If-Modified-Since"] = cur["last_modified"]
+    return headers
+
+def head_info(session, url, cur=None):
+    """HEAD do anexo; com `cur` (entrada do manifest) a requisição é condicional."""
+    cur = cur or {}
+    r = session.head(url, allow_redirects=True, timeout=TIMEOUT, headers=_cabecalhos_condicionais(cur))
+    if r.status_code == 304:
+        return {
+            "etag": r.headers.get("ETag") or cur.get("etag"),
+            "last_modified": r.headers.get("Last-Modified") or cur.get("last_modified"),
+            "content_length": cur.get("content_length"),
+            "final_url": cur.get("final_url") or r.url,
+            "partial_fp": cur.get("partial_fp"),
+            "status": 304,
+            "checked_at": datetime.now().isoformat(),
+        }
     r.raise_for_status()
     return {
         "etag": r.headers.get("ETag"),
@@ -157,142 +984,1168 @@ def head_info(session, url):
         "checked_at": datetime.now().isoformat(),
     }
 
-def small_range_fingerprint(session, url, length=1024):
-    headers = {"Range": f"bytes=0-{length-1}"}
-    r = session.get(url, headers=headers, stream=True, allow_redirects=True, timeout=TIMEOUT)
-    if r.status_code not in (200, 206): r.raise_for_status()
-    chunk = next(r.iter_content(length), b"")
-    return hashlib.sha256(chunk).hexdigest()
-
-# ====== ANEXOS ======
-ANEXO_REGEX = re.compile(r"\.(pdf|xlsx?|xsd|zip)$", re.IGNORECASE)
+# Fingerprint por amostragem (servidores sem ETag/Last-Modified/Content-Length):
+# início, fim e blocos espaçados do arquivo, pedidos numa única requisição
+# multi-range. O prefixo de versão evita que assinaturas antigas (hash só do
+# primeiro 1 KB) sejam tomadas como mudança.
+FP_VERSAO = "v2"
+FP_BLOCO = 1024
+FP_BLOCOS = 8
+
+def _versao_fp(fp):
+    return fp.split(":", 1)[0] if fp and ":" in fp else "v1"
+
+def _ler_limitado(r, limite):
+    corpo = bytearray()
+    for chunk in r.iter_content(16 * 1024):
+        corpo += chunk
+        if len(corpo) >= limite:
+            break
+    return bytes(corpo[:limite])
+
+def _partes_byteranges(corpo, boundary):
+    """{início: bytes} de uma resposta multipart/byteranges (cada parte lida pelo seu Content-Range)."""
+    sep, partes, pos = b"--" + boundary.encode("latin-1"), {}, 0
+    while True:
+        i = corpo.find(sep, pos)
+        if i < 0 or corpo[i + len(sep):i + len(sep) + 2] == b"--":
+            return partes
+        fim_cab = corpo.find(b"\r\n\r\n", i)
+        if fim_cab < 0:
+            return partes
+        m = re.search(rb"content-range:\s*bytes\s+(\d+)-(\d+)/", corpo[i:fim_cab], re.IGNORECASE)
+        pos = fim_cab + 4
+        if m:
+            ini, fim = int(m.group(1)), int(m.group(2))
+            partes[ini] = corpo[pos:pos + fim - ini + 1]
+            pos += fim - ini + 1
+
+def _ler_faixas(session, url, faixas):
+    """Lê as faixas [(início, fim)] numa requisição multi-range; sem suporte, uma por vez na mesma conexão."""
+    limite = sum(b - a + 1 for a, b in faixas)
+    r = session.get(url, headers={"Range": "bytes=" + ",".join(f"{a}-{b}" for a, b in faixas)},
+                    stream=True, allow_redirects=True, timeout=TIMEOUT)
+    try:
+        ctype = r.headers.get("Content-Type", "")
+        m = re.search(r'boundary="?([^";]+)"?', ctype, re.IGNORECASE)
+        if r.status_code == 206 and m and "multipart/byteranges" in ctype.lower():
+            partes = _partes_byteranges(_ler_limitado(r, limite + 256 * len(faixas) + 1024), m.group(1))
+            if all(partes.get(a, b"") and len(partes[a]) == b - a + 1 for a, b in faixas):
+                return partes
+        cr = re.match(r"bytes (\d+)-(\d+)/", r.headers.get("Content-Range", ""))
+        if r.status_code == 206 and cr:
+            # faixas fundidas numa só pelo servidor: serve se não for muito maior que o pedido
+            ini, fim = int(cr.group(1)), int(cr.group(2))
+            if ini <= faixas[0][0] and fim >= faixas[-1][1] and fim - ini + 1 <= 4 * limite:
+                corpo = _ler_limitado(r, fim - ini + 1)
+                return {a: corpo[a - ini:b - ini + 1] for a, b in faixas}
+    finally:
+        r.close()
 
-def verificar_anexos(urls_anexos, use_partial_fp=True):
-    manifest = _load_manifest()
-    alterados, sess = [], _session()
-    first_run = len(manifest) == 0
+    metricas.contar("range_sem_multipart")
+    partes = {}
+    for a, b in faixas:
+        r = session.get(url, headers={"Range": f"bytes={a}-{b}"}, stream=True, allow_redirects=True, timeout=TIMEOUT)
+        try:
+            if r.status_code != 206:
+                r.raise_for_status()
+                raise requests.HTTPError(f"Range ignorado (status {r.status_code})")
+            partes[a] = _ler_limitado(r, b - a + 1)
+        finally:
+            r.close()
+    return partes
+
+def small_range_fingerprint(session, url, bloco=FP_BLOCO, blocos=FP_BLOCOS):
+    """
+    Assinatura "v2:<sha256>" de amostras do arquivo: o primeiro bloco (que também
+    revela o tamanho pelo Content-Range), o último e blocos espaçados entre eles.
+    Transfere ~`bloco` × `blocos` bytes em vez do arquivo inteiro.
+    """
+    r = session.get(url, headers={"Range": f"bytes=0-{bloco - 1}"}, stream=True,
+                    allow_redirects=True, timeout=TIMEOUT)
+    try:
+        if r.status_code not in (200, 206): r.raise_for_status()
+        primeiro = _ler_limitado(r, bloco)
+        cr = re.match(r"bytes \d+-\d+/(\d+)", r.headers.get("Content-Range", "")) if r.status_code == 206 else None
+    finally:
+        r.close()
+
+    h = hashlib.sha256()
+    total = int(cr.group(1)) if cr else None
+    h.update(f"{total}|".encode())
+    h.update(b"0:" + primeiro)
+    if total and total > bloco:
+        if total <= bloco * blocos:
+            faixas = [(bloco, total - 1)]  # arquivo pequeno: o resto inteiro
+        else:
+            # blocos espaçados até o último; com total > bloco × blocos não se sobrepõem
+            passo = (total - bloco) / (blocos - 1)
+            faixas = [(round(i * passo), round(i * passo) + bloco - 1) for i in range(1, blocos)]
+        partes = _ler_faixas(session, url, faixas)
+        for a, _ in faixas:
+            h.update(f"|{a}:".encode() + partes.get(a, b""))
+    return f"{FP_VERSAO}:{h.hexdigest()}"
 
-    for url in urls_anexos:
-        cur = manifest.get(url, {})
+# ====== ANEXOS ======
+def _consultar_anexo(sess, url, use_partial_fp, cur=None):
+    """HEAD condicional do anexo (com Range como alternativa). Devolve (info, erro)."""
+    try:
+        info = head_info(sess, url, cur)
+        if info["status"] == 304:
+            metricas.contar("anexos_304")
+            return info, None
+    except (PrazoEsgotado, HostIndisponivel):
+        raise
+    except Exception as e:
+        if not use_partial_fp:
+            metricas.contar("falhas_checagem")
+            return None, f"HEAD fail: {e}"
         try:
-            info = head_info(sess, url)
-        except Exception as e:
-            if use_partial_fp:
-                try:
-                    fp = small_range_fingerprint(sess, url)
-                    info = {"etag":None,"last_modified":None,"content_length":None,
-                            "final_url":url,"partial_fp":fp,"status":None,
-                            "checked_at": datetime.now().isoformat()}
-                except Exception as e2:
-                    logger.warning(f"HEAD/Range falhou para {url}: {e2}")
-                    manifest[url] = {**cur,"error": f"HEAD/Range fail: {e2}","checked_at": datetime.now().isoformat()}
+            fp = small_range_fingerprint(sess, url)
+            metricas.contar("range_fingerprints")
+            info = {"etag":None,"last_modified":None,"content_length":None,
+                    "final_url":url,"partial_fp":fp,"status":None,
+                    "checked_at": datetime.now().isoformat()}
+        except (PrazoEsgotado, HostIndisponivel):
+            raise
+        except Exception as e2:
+            metricas.contar("falhas_checagem")
+            return None, f"HEAD/Range fail: {e2}"
+
+    if not (info.get("etag") or info.get("last_modified") or info.get("content_length")) and use_partial_fp:
+        if "partial_fp" not in info:
+            try:
+                info["partial_fp"] = small_range_fingerprint(sess, url)
+                metricas.contar("range_fingerprints")
+            except Exception: pass
+    return info, None
+
+class PipelineAnexos:
+    """
+    Checagem (e download antecipado) dos anexos em fluxo. Cada página extraída
+    entrega seus anexos com `adicionar` e eles entram na fila enquanto as outras
+    páginas ainda carregam; a fila é por prioridade (_prioridade_anexo), com
+    MAX_VERIFICACOES_SIMULTANEAS consultas no total e MAX_VERIFICACOES_POR_HOST por
+    host. Com `baixar`, um anexo que mudou já começa a ser baixado para o e-mail.
+    Nada é gravado aqui: `consultas()` devolve as respostas e o manifest é aplicado
+    depois por _verificar_anexos, na ordem de entrada. O que não terminar dentro de
+    PRAZO_VERIFICACAO_ANEXOS (contado da primeira entrada), nem antes da reserva
+    para o envio do e-mail, fica de fora.
+    """
+
+    def __init__(self, session, use_partial_fp=True, manifest=None, baixar=False, ignorar=()):
+        import queue, itertools
+        self.sess = session
+        self.use_partial_fp = use_partial_fp
+        if manifest is None:
+            conn = _manifest_db()
+            try:
+                manifest = _load_manifest(conn)
+            finally:
+                conn.close()
+        self.manifest = manifest
+        self.primeira_execucao = len(manifest) == 0
+        self.prazo = None
+        self._fila = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._vistos = set(ignorar)  # ex.: já checados numa tentativa anterior (diário)
+        self._respostas = {}
+        self._pendentes = 0
+        self._por_host = {}
+        self._trabalhadores = []
+        self._downloads = ThreadPoolExecutor(max_workers=max(1, MAX_DOWNLOADS_SIMULTANEOS)) if baixar else None
+        self._baixados = {}
+
+    def adicionar(self, urls_anexos, prioritarios=()):
+        """Enfileira os anexos ainda não vistos; pode ser chamado de qualquer thread."""
+        with self._cond:
+            prioritarios = set(prioritarios)
+            for url in urls_anexos:
+                if url in self._vistos:
                     continue
-            else:
-                logger.warning(f"HEAD falhou para {url}: {e}")
-                manifest[url] = {**cur,"error": f"HEAD fail: {e}","checked_at": datetime.now().isoformat()}
-                continue
+                if self.prazo is None:  # o prazo da checagem corre a partir do primeiro anexo na fila
+                    self.prazo = time.monotonic() + max(0.0, min(PRAZO_VERIFICACAO_ANEXOS,
+                                                                 orcamento.restante(RESERVA_ENVIO_S)))
+                self._vistos.add(url)
+                self._por_host.setdefault(urlparse(url).netloc,
+                                          threading.BoundedSemaphore(max(1, MAX_VERIFICACOES_POR_HOST)))
+                prioridade = _prioridade_anexo(url, self.manifest, prioritarios)
+                self._fila.put((prioridade, next(self._seq), url))
+                self._pendentes += 1
+            while len(self._trabalhadores) < min(max(1, MAX_VERIFICACOES_SIMULTANEAS), self._pendentes):
+                t = threading.Thread(target=self._trabalhar, name="checagem-anexos", daemon=True)
+                t.start()
+                self._trabalhadores.append(t)
+
+    def _trabalhar(self):
+        while True:
+            _, _, url = self._fila.get()
+            if url is None:
+                return
+            try:
+                resposta = self._consultar(url)
+            except Exception as e:
+                resposta = (None, str(e))
+            with self._cond:
+                self._respostas[url] = resposta
+                self._pendentes -= 1
+                self._cond.notify_all()
+
+    def _consultar(self, url):
+        sem = self._por_host[urlparse(url).netloc]
+        if not sem.acquire(timeout=max(0.0, self.prazo - time.monotonic())):
+            return None
+        try:
+            if time.monotonic() >= self.prazo:
+                return None
+            metricas.contar("anexos_checados")
+            with metricas.span("checagem_anexo", url):
+                resposta = _consultar_anexo(self.sess, url, self.use_partial_fp, self.manifest.get(url))
+        except (PrazoEsgotado, HostIndisponivel):
+            return None  # não é erro do anexo: fica para a próxima execução
+        finally:
+            sem.release()
+        if self._downloads is not None and resposta[0] is not None:
+            self._antecipar_download(url, resposta[0])
+        return resposta
+
+    def _antecipar_download(self, url, info):
+        cur = self.manifest.get(url)
+        mudou, _ = _anexo_mudou(info, cur or {}, self.use_partial_fp)
+        if (mudou or cur is None) and not (self.primeira_execucao and QUIET_BASELINE):
+            entrada = _entrada_manifest(info, cur or {}, self.use_partial_fp)
+            self._baixados[url] = self._downloads.submit(self._baixar, url, entrada)
+
+    def _baixar(self, url, entrada):
+        if orcamento.esgotado(RESERVA_ENVIO_S):
+            return None
+        cache = _cache_db()
+        try:
+            with metricas.span("download", url):
+                return baixar_para_anexo(self.sess, url, entrada, cache)
+        finally:
+            cache.close()
+
+    def consultas(self):
+        """Espera as consultas (até o prazo) e devolve {url: (info, erro)} das que terminaram."""
+        with self._cond:
+            if self.prazo is not None:
+                self._cond.wait_for(lambda: self._pendentes == 0,
+                                    timeout=max(0.0, self.prazo - time.monotonic()))
+            return {u: r for u, r in self._respostas.items() if r is not None}
+
+    def download(self, url):
+        """Resultado do download antecipado (tupla de baixar_para_anexo) ou None se não houve."""
+        fut = self._baixados.get(url)
+        if fut is None:
+            return None
+        try:
+            return fut.result()
+        except Exception as e:
+            return None, None, None, str(e), None
+
+    def fechar(self):
+        """Libera os trabalhadores; consultas ainda em andamento terminam em segundo plano."""
+        for _ in self._trabalhadores:
+            self._fila.put(((9, ""), next(self._seq), None))
+        if self._downloads is not None:
+            self._downloads.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+def verificar_anexos(urls_anexos, use_partial_fp=True, session=None, prioritarios=None, pipeline=None,
+                     diario=None):
+    """
+    Checa os anexos e aplica o manifest. Com `pipeline` as consultas já estão em
+    andamento; com `diario` os anexos já checados na execução não são consultados de
+    novo e os alterados devolvidos incluem os das tentativas anteriores.
+    """
+    conn = _manifest_db()
+    try:
+        return _verificar_anexos(conn, urls_anexos, use_partial_fp, session, prioritarios, pipeline, diario)
+    finally:
+        conn.close()
+
+def comparar_com_manifest(urls_anexos):
+    """
+    Replay: nenhuma requisição aos anexos, só os links das páginas contra o manifest.
+    Devolve (novos, ausentes): os documentos que o manifest não conhece (no formato
+    dos alterados) e os que ele conhece mas não aparecem nas páginas.
+    """
+    conn = _manifest_db()
+    try:
+        manifest = _load_manifest(conn)
+    finally:
+        conn.close()
+    vistos = set(urls_anexos)
+    novos = [{"url": u, "evidencia": "novo documento (replay, anexo não checado)"}
+             for u in dict.fromkeys(urls_anexos) if u not in manifest]
+    return novos, [u for u in manifest if u not in vistos]
+
+def _prioridade_anexo(url, manifest, prioritarios):
+    """Primeiro os anexos de páginas com data de hoje e os nunca vistos; depois, os checados há mais tempo."""
+    cur = manifest.get(url)
+    urgente = url in prioritarios or cur is None
+    return (0 if urgente else 1, (cur or {}).get("checked_at") or "")
+
+def _anexo_mudou(info, cur, use_partial_fp):
+    """(mudou, fp_comparavel) da resposta `info` em relação à entrada `cur` do manifest."""
+    changed = (
+        (info.get("etag") and info.get("etag") != cur.get("etag")) or
+        (info.get("last_modified") and info.get("last_modified") != cur.get("last_modified")) or
+        (info.get("content_length") and info.get("content_length") != cur.get("content_length")) or
+        (info.get("final_url") and info.get("final_url") != cur.get("final_url"))
+    )
+
+    # assinatura de outra versão do algoritmo não é comparável: vira a nova base
+    fp_comparavel = _versao_fp(info.get("partial_fp")) == _versao_fp(cur.get("partial_fp")) \
+        or not cur.get("partial_fp")
+    if not (info.get("etag") or info.get("last_modified") or info.get("content_length")) and use_partial_fp:
+        if info.get("partial_fp") and info.get("partial_fp") != cur.get("partial_fp") and fp_comparavel:
+            changed = True
+    return bool(changed), fp_comparavel
+
+def _entrada_manifest(info, cur, use_partial_fp):
+    entrada = {
+        "etag": info.get("etag"),
+        "last_modified": info.get("last_modified"),
+        "content_length": info.get("content_length"),
+        "final_url": info.get("final_url"),
+        "partial_fp": info.get("partial_fp") if use_partial_fp else cur.get("partial_fp"),
+        "checked_at": info.get("checked_at"),
+    }
+    if cur.get("sha256"):
+        # hash do último conteúdo baixado; comparado com o próximo download
+        entrada["sha256"] = cur["sha256"]
+    return entrada
+
+def _verificar_anexos(conn, urls_anexos, use_partial_fp, session=None, prioritarios=None, pipeline=None,
+                      diario=None):
+    manifest = _load_manifest(conn)
+    alterados, sess = [], session or _session()
+    first_run = len(manifest) == 0
 
-        changed = (
-            (info.get("etag") and info.get("etag") != cur.get("etag")) or
-            (info.get("last_modified") and info.get("last_modified") != cur.get("last_modified")) or
-            (info.get("content_length") and info.get("content_length") != cur.get("content_length")) or
-            (info.get("final_url") and info.get("final_url") != cur.get("final_url"))
-        )
+    ja_checados = set(diario.entradas("anexo")) if diario is not None else set()
+    unicos = [u for u in dict.fromkeys(urls_anexos) if u not in ja_checados]
+    if pipeline is None:
+        with PipelineAnexos(sess, use_partial_fp, manifest) as p:
+            p.adicionar(unicos, prioritarios or ())
+            consultas = p.consultas()
+    else:
+        pipeline.adicionar(unicos, prioritarios or ())  # os que ainda não tinham sido encaminhados
+        consultas = pipeline.consultas()
+    sem_resposta = [u for u in unicos if u not in consultas]
+    if sem_resposta:
+        metricas.contar("anexos_fora_do_prazo", len(sem_resposta))
+        orcamento.registrar_motivo(f"{len(sem_resposta)} anexo(s) não checado(s) (prazo ou host em pausa), "
+                                   f"ficam para a próxima execução")
+
+    # documento de cada URL final já conhecida: um link novo que redireciona para o
+    # mesmo arquivo vira alias do documento existente em vez de "novo arquivo"
+    por_final = {}
+    for chave, entrada in manifest.items():
+        if entrada.get("final_url"):
+            por_final.setdefault(canonizar_url(entrada["final_url"]), chave)
+
+    # aplica na ordem de entrada, para o resultado não depender de qual thread terminou antes
+    for url_checada in urls_anexos:
+        if url_checada not in consultas:
+            continue
+        url = url_checada
+        info, erro = consultas[url]
+        final = canonizar_url(info["final_url"]) if info and info.get("final_url") else None
+        documento = por_final.get(final) if final else None
+        if documento and documento != url and url not in manifest:
+            _manifest_gravar_alias(conn, url, documento, f"mesma URL final: {info['final_url']}")
+            logger.info(f"Anexo {url} é o mesmo documento que {documento} (mesma URL final)")
+            metricas.contar("anexos_alias")
+            if documento in consultas:
+                continue  # já checado nesta execução com a outra grafia
+            url = documento
+        cur = manifest.get(url, {})
+        if info is None:
+            logger.warning(f"Falha ao consultar anexo {url}: {erro}")
+            manifest[url] = {**cur,"error": erro,"checked_at": datetime.now().isoformat()}
+            _manifest_gravar(conn, url, manifest[url])
+            continue
 
-        if not (info.get("etag") or info.get("last_modified") or info.get("content_length")) and use_partial_fp:
-            if "partial_fp" not in info:
-                try: info["partial_fp"] = small_range_fingerprint(sess, url)
-                except Exception: pass
-            if info.get("partial_fp") and info.get("partial_fp") != cur.get("partial_fp"):
-                changed = True
+        changed, fp_comparavel = _anexo_mudou(info, cur, use_partial_fp)
 
+        evidencia, checkpoints = None, [("anexo", url_checada, None)] if diario is not None else []
         if changed or url not in manifest:
+            reasons = []
+            for k in ("etag","last_modified","content_length","final_url","partial_fp"):
+                if k == "partial_fp" and not fp_comparavel: continue
+                if info.get(k) and info.get(k) != cur.get(k): reasons.append(f"{k} mudou")
+            if not reasons: reasons.append("novo arquivo observado")
+            evidencia = ", ".join(reasons)
             if not (first_run and QUIET_BASELINE):
-                reasons = []
-                for k in ("etag","last_modified","content_length","final_url","partial_fp"):
-                    if info.get(k) and info.get(k) != cur.get(k): reasons.append(f"{k} mudou")
-                if not reasons: reasons.append("novo arquivo observado")
                 logger.info(f"Alteração detectada em anexo: {url} | {'; '.join(reasons)}")
-                alterados.append({"url": url, "evidencia": ", ".join(reasons)})
-
-        manifest[url] = {
-            "etag": info.get("etag"),
-            "last_modified": info.get("last_modified"),
-            "content_length": info.get("content_length"),
-            "final_url": info.get("final_url"),
-            "partial_fp": info.get("partial_fp") if use_partial_fp else cur.get("partial_fp"),
-            "checked_at": info.get("checked_at"),
-        }
-
-    _save_manifest(manifest)
+                metricas.contar("anexos_alterados")
+                alterado = {"url": url, "evidencia": evidencia}
+                if url != url_checada:
+                    alterado["vista_como"] = url_checada
+                alterados.append(alterado)
+                if diario is not None:
+                    checkpoints.append(("alterado", url, alterado))
+
+        manifest[url] = _entrada_manifest(info, cur, use_partial_fp)
+        if final:
+            por_final.setdefault(final, url)
+        _manifest_gravar(conn, url, manifest[url], evidencia, diario, checkpoints)
+
+    if diario is not None:
+        alterados = list(diario.entradas("alterado").values())  # inclusive os de tentativas anteriores
     return alterados, manifest
 
 
 # ====== PLAYWRIGHT ======
-def extrair_anexos_4111(page):
-    linha_4111 = page.locator("tr").filter(has_text="4111")
-    urls_4111, categorias = [], {}
-    if linha_4111.count() > 0:
-        links = linha_4111.locator("a")
-        for i in range(links.count()):
-            href = links.nth(i).get_attribute("href")
-            if href:
-                abs_url = page.evaluate("url => new URL(url, document.baseURI).toString()", href)
-                if any(s in abs_url.lower() for s in [".pdf", ".xsd"]):
-                    urls_4111.append(abs_url)
-                    categorias[abs_url] = "4111 - SCD"
-    return urls_4111, categorias
-
-def extrair_datas_categorias_e_anexos(url):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True, args=["--no-sandbox", "--disable-dev-shm-usage"])
-        page = browser.new_page()
-        page.goto(url, timeout=60000, wait_until="load")
-        try: page.wait_for_selector("table", timeout=5000)
-        except: pass
-
-        if "leiautedocumentoscrd" in url.lower():
-            anexos_4111, categorias_4111 = extrair_anexos_4111(page)
-            browser.close()
-            return [], anexos_4111, categorias_4111
-
-        datas = []
-        try:
-            for cell in page.query_selector_all("td"):
-                text = (cell.inner_text() or "").strip()
-                if len(text) == 10 and text[2] == "/" and text[5] == "/":
-                    datas.append(text)
-        except: pass
-
+CHROMIUM_ARGS = ["--no-sandbox", "--disable-dev-shm-usage"]
+
+# Carregamento enxuto: imagens, mídia, fontes e rastreadores são abortados e a
+# leitura começa assim que a região "pronto" da espec existe, sem esperar o "load"
+CARREGAMENTO_ENXUTO = os.environ.get("MONITOR_CARREGAMENTO_ENXUTO", "1") != "0"
+RECURSOS_BLOQUEADOS = {"image", "media", "font"}
+HOSTS_BLOQUEADOS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googleadservices.com",
+    "facebook.net", "facebook.com", "hotjar.com", "clarity.ms", "nr-data.net", "newrelic.com",
+    "youtube.com", "ytimg.com", "vlibras.gov.br", "barra.sistema.gov.br",
+)
+PRONTO_TIMEOUT_MS = 15000
+# O seletor "pronto" aparece com o primeiro link; tabelas montadas por JavaScript
+# continuam crescendo. A leitura espera o número de linhas/links ficar parado por
+# PRONTO_ESTAVEL_MS (conferido na própria página, a cada 100 ms).
+PRONTO_ESTAVEL_MS = int(os.environ.get("MONITOR_PRONTO_ESTAVEL_MS", "400"))
+JS_REGIAO_ESTAVEL = r"""(ms) => {
+  const n = document.querySelectorAll('tr, a[href]').length;
+  const agora = performance.now();
+  const e = window.__leiautesRegiao;
+  if (!e || e.n !== n) { window.__leiautesRegiao = { n, desde: agora }; return false; }
+  return agora - e.desde >= ms;
+}"""
+
+def _bloquear_requisicao(url, tipo):
+    host = (urlsplit(url).hostname or "").lower()
+    return tipo in RECURSOS_BLOQUEADOS or any(host == h or host.endswith("." + h) for h in HOSTS_BLOQUEADOS)
+
+async def _rotear(route):
+    req = route.request
+    if _bloquear_requisicao(req.url, req.resource_type):
+        metricas.contar("recursos_bloqueados")
+        await route.abort()
+    else:
+        await route.continue_()
+
+def _filtrar_anexos(items):
+    categoria_por_url, anexos, seen = {}, [], set()
+    for it in items:
+        u = it.get("href") or ""
+        if not u: continue
+        pl = u.lower()
+        if ONLY_ATUAL and "/atual/" not in pl: continue
+        if any(pat in pl for pat in EXCLUDE_PATTERNS): continue
+        if u not in seen:
+            seen.add(u)
+            anexos.append(u)
+            categoria_por_url[u] = (it.get("categoria") or "Sem categoria").strip()
+    return anexos, categoria_por_url
+
+def _resultado_por_espec(espec, datas, links):
+    """(datas, anexos, categorias) a partir dos links que já casaram com a linha/regex da espec."""
+    items = [{"href": l["href"], "text": l.get("text", ""), "categoria": espec["categoria"]} for l in links]
+    if espec["filtrar"]:
+        anexos, categorias = _filtrar_anexos(items)
+    else:
+        anexos = list(dict.fromkeys(it["href"] for it in items if it["href"]))
+        categorias = {u: espec["categoria"] for u in anexos}
+    return (datas if espec["datas"] else []), anexos, categorias
+
+# Uma única ida ao navegador por página: texto do fingerprint (tabelas + links de
+# anexos), datas e links que casam com a espec, já com a URL absoluta. Com
+# espec.html, devolve também o HTML do snapshot: <base>, tabelas e links de anexos
+# fora delas (o que _extrair_html_estatico lê), sem serializar o DOM inteiro
+JS_EXTRAIR_PAGINA = r"""(espec) => {
+  const isAsset = (h) => /\.(pdf|xlsx?|xsd|zip)$/i.test(h||"");
+  const tabelas = Array.from(document.querySelectorAll('table')).map(t => t.innerText || '');
+  const hrefs = Array.from(document.querySelectorAll('a[href]'))
+    .map(a => a.getAttribute('href') || '').filter(isAsset);
+  const fingerprint = [document.baseURI, ...tabelas, ...hrefs].join('\n');
+
+  const anexo = new RegExp(espec.anexo, 'i');
+  const escopos = espec.linha
+    ? Array.from(document.querySelectorAll('tr')).filter(tr => (tr.textContent || '').includes(espec.linha))
+    : [document];
+  const links = [];
+  for (const escopo of escopos) {
+    for (const a of escopo.querySelectorAll('a[href]')) {
+      let href;
+      try { href = new URL(a.getAttribute('href'), document.baseURI).toString(); } catch (e) { continue; }
+      if (anexo.test(href)) links.push({ href, text: (a.textContent || '').trim() });
+    }
+  }
+  const datas = !espec.datas ? [] : Array.from(document.querySelectorAll('td'))
+    .map(td => (td.innerText || '').trim())
+    .filter(t => t.length === 10 && t[2] === '/' && t[5] === '/');
+  if (!espec.html) return { fingerprint, datas, links };
+
+  const attr = (s) => s.replace(/&/g, '&amp;').replace(/"/g, '&quot;');
+  const soltos = Array.from(document.querySelectorAll('a[href]'))
+    .filter(a => !a.closest('table'))
+    .filter(a => isAsset(a.getAttribute('href')) || anexo.test(a.getAttribute('href') || ''))
+    .map(a => a.outerHTML);
+  const html = '<html><head><base href="' + attr(document.baseURI) + '"></head><body>\n'
+    + Array.from(document.querySelectorAll('table')).map(t => t.outerHTML).join('\n') + '\n'
+    + soltos.join('\n') + '\n</body></html>';
+  return { fingerprint, datas, links, html };
+}"""
+
+async def _extrair_da_pagina(page, url, cache_paginas=None):
+    espec = espec_da_pagina(url)
+    trafego = {"respostas": 0, "bytes": 0}
+
+    def _resposta(resp):
+        # Content-Length basta para a medição; respostas "chunked" ficam de fora
+        trafego["respostas"] += 1
+        cl = resp.headers.get("content-length", "")
+        if cl.isdigit():
+            trafego["bytes"] += int(cl)
+
+    page.on("response", _resposta)
+    controle = controle_host(url)
+    controle.verificar()
+
+    def _ms(limite_ms):
+        # timeouts do Playwright limitados ao prazo da execução (menos a reserva do envio)
+        resta = orcamento.restante(RESERVA_ENVIO_S)
+        if resta <= 0:
+            raise PrazoEsgotado("prazo da execução esgotado")
+        return max(1, int(min(limite_ms, resta * 1000)))
+
+    with metricas.span("page_goto", url):
         try:
-            items = page.evaluate("""() => {
-              const res = [];
-              const isAsset = (h) => /\.(pdf|xlsx?|xsd|zip)$/i.test(h||"");
-              for (const a of Array.from(document.querySelectorAll('a[href]'))) {
-                const href = a.getAttribute('href') || '';
-                if (!isAsset(href)) continue;
-                const abs = new URL(href, document.baseURI).toString();
-                res.push({ href: abs, text: (a.textContent || '').trim(), categoria: 'Sem categoria' });
-              }
-              return res;
-            }""")
+            if CARREGAMENTO_ENXUTO:
+                await page.goto(url, timeout=_ms(60000), wait_until="domcontentloaded")
+                try:
+                    await page.wait_for_selector(espec["pronto"], state="attached", timeout=_ms(PRONTO_TIMEOUT_MS))
+                except PrazoEsgotado:
+                    raise
+                except Exception:
+                    # a região esperada não apareceu: lê a página completa, como antes
+                    logger.info(f"Seletor '{espec['pronto']}' não apareceu em {url}; esperando o load")
+                    await page.wait_for_load_state("load", timeout=_ms(60000))
+                # leitura de tabela pela metade seria gravada no cache como resultado da página
+                try:
+                    await page.wait_for_function(JS_REGIAO_ESTAVEL, arg=PRONTO_ESTAVEL_MS, polling=100,
+                                                 timeout=_ms(PRONTO_TIMEOUT_MS))
+                except PrazoEsgotado:
+                    raise
+                except Exception:
+                    logger.info(f"Tabelas de {url} ainda mudando; esperando a rede parar")
+                    await page.wait_for_load_state("networkidle", timeout=_ms(60000))
+            else:
+                await page.goto(url, timeout=_ms(60000), wait_until="load")
+                try: await page.wait_for_selector(espec["pronto"], timeout=_ms(5000))
+                except: pass
+        except PrazoEsgotado:
+            raise
         except Exception:
-            items = []
+            controle.falha()
+            raise
+        controle.sucesso()
+    metricas.contar("bytes_chromium", trafego["bytes"])
+    logger.info(f"Página carregada no Chromium: {url} ({trafego['respostas']} respostas, "
+                f"{trafego['bytes'] / 1024:.0f} KB)")
+
+    with metricas.span("extracao_dom", url):
+        dados = await page.evaluate(JS_EXTRAIR_PAGINA, {**{k: espec[k] for k in ("linha", "datas", "anexo")},
+                                                        "html": GRAVAR_SNAPSHOTS})
+    if GRAVAR_SNAPSHOTS:
+        # recorte do DOM montado (vindo no mesmo evaluate) + o que foi extraído; gravado fora do loop
+        await asyncio.to_thread(gravar_snapshot, url, "playwright", dados["html"], page.url, None,
+                                {"datas": dados["datas"], "links": dados["links"]})
+    fingerprint = _hash_normalizado(dados["fingerprint"])
+    extracao = versao_extracao(espec)
+    if cache_paginas is not None:
+        anterior = cache_paginas.get(url) or {}
+        if _cache_pagina_vale(anterior, "playwright", extracao) and anterior.get("fingerprint") == fingerprint:
+            logger.info(f"Página sem alteração (fingerprint): {url}")
+            metricas.contar("paginas_fingerprint")
+            return _resultado_do_cache(anterior)
+
+    res = _resultado_por_espec(espec, dados["datas"], dados["links"])
+    if cache_paginas is not None:
+        cache_paginas[url] = _registro_pagina(res, "playwright", fingerprint, extracao)
+    return res
+
+
+# Navegador persistente (MONITOR_NAVEGADOR_PERSISTENTE=1): um Chromium que fica no ar
+# entre as execuções do cron, com --remote-debugging-port e perfil próprio em
+# runtime/chromium_perfil (cache HTTP em disco). Cada execução só se conecta a ele
+# (connect_over_cdp); se ele não responder ao health check, é (re)iniciado. No
+# carregamento enxuto o bloqueio é feito por Network.setBlockedURLs (CDP), porque
+# o context.route do Playwright desliga o cache HTTP.
+NAVEGADOR_PERSISTENTE = os.environ.get("MONITOR_NAVEGADOR_PERSISTENTE", "0") == "1"
+NAVEGADOR_PORTA = int(os.environ.get("MONITOR_NAVEGADOR_PORTA", "9222"))
+NAVEGADOR_PERFIL_DIR = BASE / "runtime" / "chromium_perfil"
+NAVEGADOR_CACHE_MB = int(os.environ.get("MONITOR_NAVEGADOR_CACHE_MB", "200"))
+NAVEGADOR_INICIO_TIMEOUT_S = 20
+EXTENSOES_BLOQUEADAS = {
+    "image": ("png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "bmp"),
+    "font": ("woff", "woff2", "ttf", "otf", "eot"),
+    "media": ("mp4", "webm", "ogg", "mp3", "wav", "m4a"),
+}
+
+def _padroes_bloqueados():
+    """Equivalente de _bloquear_requisicao em padrões de URL para Network.setBlockedURLs."""
+    padroes = [f"*.{ext}" for tipo in sorted(RECURSOS_BLOQUEADOS) for ext in EXTENSOES_BLOQUEADAS.get(tipo, ())]
+    padroes += [f"*.{ext}?*" for tipo in sorted(RECURSOS_BLOQUEADOS) for ext in EXTENSOES_BLOQUEADAS.get(tipo, ())]
+    for host in HOSTS_BLOQUEADOS:
+        padroes += [f"*://{host}/*", f"*://*.{host}/*"]
+    return padroes
+
+def _servidor_info_path():
+    return NAVEGADOR_PERFIL_DIR / "servidor.json"
+
+def navegador_servidor_saudavel(porta=None, timeout=2.0):
+    """Health check: o endpoint /json/version do DevTools responde? Devolve o JSON ou None."""
+    try:
+        r = requests.get(f"http://127.0.0.1:{porta or NAVEGADOR_PORTA}/json/version", timeout=timeout)
+        return r.json() if r.ok and r.json().get("webSocketDebuggerUrl") else None
+    except (requests.RequestException, ValueError):
+        return None
 
-        browser.close()
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except (OSError, TypeError):
+        return False
+
+def parar_navegador_servidor():
+    """Encerra o Chromium persistente (SIGTERM e, se preciso, SIGKILL)."""
+    import signal
+    try:
+        pid = json.loads(_servidor_info_path().read_text(encoding="utf-8"))["pid"]
+    except (OSError, ValueError, KeyError):
+        return False
+    for sig, espera in ((signal.SIGTERM, 5.0), (signal.SIGKILL, 2.0)):
+        if not _processo_vivo(pid):
+            break
+        try:
+            os.killpg(pid, sig)  # o Chromium e os processos filhos (renderers, GPU...)
+        except OSError:
+            pass
+        limite = time.monotonic() + espera
+        while _processo_vivo(pid) and time.monotonic() < limite:
+            time.sleep(0.1)
+    _servidor_info_path().unlink(missing_ok=True)
+    logger.info(f"Chromium persistente encerrado (pid {pid})")
+    return True
+
+def garantir_navegador_servidor(executavel):
+    """
+    Deixa o Chromium persistente no ar e devolve o endpoint CDP. Se ele não responde
+    (morreu ou travou), o processo antigo é encerrado e um novo é iniciado. Um lock
+    de arquivo evita que duas execuções simultâneas subam dois navegadores.
+    """
+    import fcntl, subprocess
+    endpoint = f"http://127.0.0.1:{NAVEGADOR_PORTA}"
+    if navegador_servidor_saudavel():
+        return endpoint
+    NAVEGADOR_PERFIL_DIR.mkdir(parents=True, exist_ok=True)
+    with open(NAVEGADOR_PERFIL_DIR / "servidor.lock", "w") as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX)
+        if navegador_servidor_saudavel():
+            return endpoint  # outra execução acabou de subir
+        if _servidor_info_path().exists():
+            logger.warning("Chromium persistente sem resposta; reiniciando")
+            metricas.contar("navegador_reinicios")
+            parar_navegador_servidor()
+        LOG_DIR.mkdir(exist_ok=True)
+        args = [executavel, "--headless=new", *CHROMIUM_ARGS,
+                f"--remote-debugging-port={NAVEGADOR_PORTA}", "--remote-debugging-address=127.0.0.1",
+                f"--user-data-dir={NAVEGADOR_PERFIL_DIR / 'perfil'}",
+                f"--disk-cache-dir={NAVEGADOR_PERFIL_DIR / 'cache'}",
+                f"--disk-cache-size={NAVEGADOR_CACHE_MB * 1024 * 1024}",
+                "--no-first-run", "--no-default-browser-check", "--disable-background-networking",
+                "about:blank"]
+        with open(LOG_DIR / "chromium_servidor.log", "ab") as saida:
+            # sessão própria: o navegador sobrevive ao fim do processo do cron
+            proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=saida, stderr=saida,
+                                    start_new_session=True)
+        limite = time.monotonic() + NAVEGADOR_INICIO_TIMEOUT_S
+        while not navegador_servidor_saudavel():
+            if proc.poll() is not None or time.monotonic() > limite:
+                raise RuntimeError(f"Chromium persistente não subiu (veja {LOG_DIR / 'chromium_servidor.log'})")
+            time.sleep(0.2)
+        _servidor_info_path().write_text(json.dumps({
+            "pid": proc.pid, "porta": NAVEGADOR_PORTA, "executavel": executavel,
+            "iniciado_em": datetime.now().isoformat()}), encoding="utf-8")
+        logger.info(f"Chromium persistente iniciado (pid {proc.pid}, porta {NAVEGADOR_PORTA})")
+    return endpoint
+
+
+class NavegadorCompartilhado:
+    """
+    Um único Chromium por execução, compartilhado por todas as páginas monitoradas.
+    O Playwright assíncrono roda num loop próprio (thread dedicada), então o resto
+    do script continua síncrono: cada URL vira uma aba no mesmo contexto, com no
+    máximo `max_paginas` abas carregando ao mesmo tempo. O navegador só é aberto
+    na primeira página pedida. Com NAVEGADOR_PERSISTENTE ele não é lançado: a
+    execução se conecta ao Chromium persistente e só se desconecta no fim.
+    """
+
+    def __init__(self, max_paginas=MAX_PAGINAS_SIMULTANEAS):
+        self.max_paginas = max(1, int(max_paginas))
+        self._loop = None
+        self._thread = None
+        self._pw = None
+        self._browser = None
+        self._context = None
+        self._sem = None
+        self._abrindo = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def _garantir_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever,
+                                            name="playwright-loop", daemon=True)
+            self._thread.start()
+
+    async def _abrir(self):
+        # roda sempre dentro do loop: a criação preguiçosa dos primitivos é segura
+        if self._abrindo is None:
+            self._abrindo = asyncio.Lock()
+            self._sem = asyncio.Semaphore(self.max_paginas)
+        async with self._abrindo:
+            if self._browser is not None and not self._browser.is_connected():
+                logger.warning("Conexão com o Chromium perdida; reabrindo")
+                self._browser = self._context = None
+            if self._browser is None:
+                with metricas.span("chromium_inicio"):
+                    if self._pw is None:
+                        from playwright.async_api import async_playwright
+                        self._pw = await async_playwright().start()
+                    if NAVEGADOR_PERSISTENTE:
+                        endpoint = await asyncio.to_thread(garantir_navegador_servidor,
+                                                           self._pw.chromium.executable_path)
+                        self._browser = await self._pw.chromium.connect_over_cdp(endpoint)
+                        self._context = self._browser.contexts[0]  # contexto do perfil (cache em disco)
+                    else:
+                        self._browser = await self._pw.chromium.launch(headless=True, args=CHROMIUM_ARGS)
+                        self._context = await self._browser.new_context()
+                        if CARREGAMENTO_ENXUTO:
+                            await self._context.route("**/*", _rotear)
+                modo = f"persistente na porta {NAVEGADOR_PORTA}" if NAVEGADOR_PERSISTENTE else "iniciado"
+                logger.info(f"Chromium {modo} (até {self.max_paginas} páginas simultâneas)")
+
+    async def _extrair(self, url, cache_paginas=None):
+        await self._abrir()
+        async with self._sem:
+            page = await self._context.new_page()
+            try:
+                if NAVEGADOR_PERSISTENTE and CARREGAMENTO_ENXUTO:
+                    cdp = await self._context.new_cdp_session(page)
+                    await cdp.send("Network.enable")
+                    await cdp.send("Network.setBlockedURLs", {"urls": _padroes_bloqueados()})
+                return await _extrair_da_pagina(page, url, cache_paginas)
+            finally:
+                await page.close()
+
+    def submeter(self, url, cache_paginas=None):
+        """Agenda a extração de `url`; devolve um concurrent.futures.Future."""
+        self._garantir_loop()
+        return asyncio.run_coroutine_threadsafe(self._extrair(url, cache_paginas), self._loop)
+
+    def extrair(self, urls_paginas):
+        """Extrai todas as páginas em paralelo; o valor é a tupla ou a exceção da página."""
+        futuros = {u: self.submeter(u) for u in urls_paginas}
+        resultados = {}
+        for u, fut in futuros.items():
+            try:
+                resultados[u] = fut.result()
+            except Exception as e:
+                resultados[u] = e
+        return resultados
+
+    def fechar(self):
+        if self._loop is None:
+            return
+
+        async def _fechar():
+            # no persistente o contexto é o do perfil: fica aberto e o close só desconecta
+            contexto = None if NAVEGADOR_PERSISTENTE else self._context
+            for obj in (contexto, self._browser):
+                if obj is not None:
+                    try: await obj.close()
+                    except Exception: pass
+            if self._pw is not None:
+                await self._pw.stop()
 
-        categoria_por_url, anexos, seen = {}, [], set()
-        for it in items:
-            u = it.get("href") or ""
-            if not u: continue
-            pl = u.lower()
-            if ONLY_ATUAL and "/atual/" not in pl: continue
-            if any(pat in pl for pat in EXCLUDE_PATTERNS): continue
-            if u not in seen:
-                seen.add(u)
-                anexos.append(u)
-                categoria_por_url[u] = (it.get("categoria") or "Sem categoria").strip()
-        return datas, anexos, categoria_por_url
+        try:
+            asyncio.run_coroutine_threadsafe(_fechar(), self._loop).result(timeout=30)
+        except Exception as e:
+            logger.warning(f"Falha ao fechar o Chromium: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop.close()
+        self._loop = self._thread = None
+        self._pw = self._browser = self._context = None
+        self._sem = self._abrindo = None
+
+
+# ====== EXTRAÇÃO HTTP (sem navegador) ======
+class _ExtratorHTML(HTMLParser):
+    """
+    Lê do HTML estático só o que o monitor usa: texto das células <td>,
+    âncoras com href (e as linhas <tr> que as contêm), quantidade de tabelas e <base href>.
+    """
+
+    _RASTREADAS = ("table", "tr", "td", "a")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.base = None
+        self.tabelas = 0
+        self.celulas = []
+        self.linhas = []
+        self.links = []
+        self._pilha = []
+        self._ignorar = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._ignorar += 1
+            return
+        if tag == "base" and self.base is None:
+            self.base = dict(attrs).get("href")
+            return
+        if tag not in self._RASTREADAS:
+            return
+        if tag == "table":
+            self.tabelas += 1
+            self._pilha.append(("table", None))
+        elif tag == "tr":
+            self._fechar_implicito("tr", "table")
+            linha = {"texto": [], "links": []}
+            self.linhas.append(linha)
+            self._pilha.append(("tr", linha))
+        elif tag == "td":
+            self._fechar_implicito("td", "tr")
+            self._pilha.append(("td", []))
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href is None:
+                return
+            link = {"href": href, "texto": []}
+            self.links.append(link)
+            for t, obj in self._pilha:
+                if t == "tr":
+                    obj["links"].append(link)
+            self._pilha.append(("a", link))
+
+    def _fechar_implicito(self, tag, limite):
+        # <td> novo fecha o <td> aberto na mesma linha; <tr> novo, o <tr> da mesma tabela
+        for t, _ in reversed(self._pilha):
+            if t == limite:
+                return
+            if t == tag:
+                self.handle_endtag(tag)
+                return
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self._ignorar = max(0, self._ignorar - 1)
+            return
+        if tag not in self._RASTREADAS or not any(t == tag for t, _ in self._pilha):
+            return
+        # fecha também o que ficou aberto dentro (HTML com </td>/</tr> omitidos)
+        while self._pilha:
+            t, obj = self._pilha.pop()
+            if t == "td":
+                self.celulas.append("".join(obj).strip())
+            if t == tag:
+                break
+
+    def handle_data(self, data):
+        if self._ignorar:
+            return
+        for t, obj in self._pilha:
+            if t == "td":
+                obj.append(data)
+            elif t == "tr":
+                obj["texto"].append(data)
+            elif t == "a":
+                obj["texto"].append(data)
+
+    def close(self):
+        super().close()
+        while self._pilha:
+            t, obj = self._pilha.pop()
+            if t == "td":
+                self.celulas.append("".join(obj).strip())
+
+
+def _url_absoluta(base, href):
+    """Equivalente a `new URL(href, base).toString()` para os casos das páginas do Bacen."""
+    href = re.sub(r"[\t\n\r]", "", href.strip()).replace("\\", "/")
+    sp = urlsplit(urljoin(base, href))
+    path = quote(sp.path, safe="/%:@!$&'()*+,;=[]^|~")
+    query = quote(sp.query, safe="/%:@!$&()*+,;=?[]^`{|}~")
+    frag = quote(sp.fragment, safe="/%:@!$&'()*+,;=?[]^#{|}~")
+    return urlunsplit((sp.scheme.lower(), sp.netloc.lower(), path or "/", query, frag))
+
+def _decodificar_html(r):
+    ctype = r.headers.get("Content-Type", "")
+    if "charset=" in ctype.lower() and r.encoding:
+        return r.content.decode(r.encoding, errors="replace")
+    return r.content.decode("utf-8", errors="replace")
+
+def extrair_pagina_http(session, url, cache_paginas=None):
+    """
+    Extrai datas e anexos do HTML estático, sem navegador. Devolve None quando a
+    página não traz tabela/anexos no HTML (conteúdo montado por JavaScript).
+    Com `cache_paginas` o GET é condicional (304 reaproveita o último resultado) e,
+    se a região relevante do HTML tiver o mesmo fingerprint, a extração é pulada.
+    """
+    anterior = (cache_paginas or {}).get(url) or {}
+    extracao = versao_extracao(espec_da_pagina(url))
+    # com outra espec/versão do extrator, nem o 304 nem o fingerprint servem
+    em_cache = _cache_pagina_vale(anterior, "http", extracao)
+    headers = _cabecalhos_condicionais(anterior) if em_cache else {}
+    r = session.get(url, allow_redirects=True, timeout=TIMEOUT, headers=headers)
+    if r.status_code == 304 and headers:
+        logger.info(f"Página sem alteração (304): {url}")
+        metricas.contar("paginas_304")
+        renovar_snapshot(url)
+        return _resultado_do_cache(anterior)
+    r.raise_for_status()
+    metricas.contar("bytes_paginas", len(r.content))
+
+    html = _decodificar_html(r)
+    gravar_snapshot(url, "http", html, r.url, {k: r.headers.get(k) for k in ("ETag", "Last-Modified", "Content-Type")})
+    fingerprint = _fingerprint_html(html, r.url)
+    if em_cache and anterior.get("fingerprint") == fingerprint:
+        logger.info(f"Página sem alteração (fingerprint): {url}")
+        metricas.contar("paginas_fingerprint")
+        anterior["etag"] = r.headers.get("ETag")
+        anterior["last_modified"] = r.headers.get("Last-Modified")
+        return _resultado_do_cache(anterior)
+
+    res = _extrair_html_estatico(html, r.url, url)
+    if cache_paginas is not None:
+        if res is not None:
+            cache_paginas[url] = _registro_pagina(res, "http", fingerprint, extracao,
+                                                  r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        elif em_cache:
+            cache_paginas.pop(url, None)
+    return res
+
+_RE_RUIDO_HTML = re.compile(r"<script\b.*?</script\s*>|<style\b.*?</style\s*>|<!--.*?-->", re.IGNORECASE | re.DOTALL)
+_RE_TABELAS = re.compile(r"<table\b.*</table\s*>", re.IGNORECASE | re.DOTALL)
+_RE_TAGS_RELEVANTES = re.compile(
+    r"""<base\b[^>]*>|<a\b[^>]*?\bhref\s*=\s*["']?[^"'\s>]*\.(?:pdf|xlsx?|xsd|zip)["'\s>][^>]*>?""",
+    re.IGNORECASE)
+
+def _fingerprint_html(html, url_final):
+    """Hash da região que o monitor lê (tabelas, <base> e links de anexos), sem scripts/estilos."""
+    limpo = _RE_RUIDO_HTML.sub("", html)
+    partes = [url_final]
+    partes.extend(m.group(0) for m in _RE_TABELAS.finditer(limpo))
+    partes.extend(m.group(0) for m in _RE_TAGS_RELEVANTES.finditer(limpo))
+    return _hash_normalizado("\n".join(partes))
+
+def _extrair_html_estatico(html, url_final, url):
+    parser = _ExtratorHTML()
+    parser.feed(html)
+    parser.close()
+
+    base = urljoin(url_final, parser.base) if parser.base else url_final
+    espec = espec_da_pagina(url)
+    anexo = re.compile(espec["anexo"], re.IGNORECASE)
+
+    if espec["linha"]:
+        candidatos = [l for linha in parser.linhas if espec["linha"] in "".join(linha["texto"])
+                      for l in linha["links"]]
+    else:
+        candidatos = parser.links
+    links = []
+    for link in candidatos:
+        if not link["href"]:
+            continue
+        abs_url = _url_absoluta(base, link["href"])
+        if anexo.search(abs_url):
+            links.append({"href": abs_url, "text": "".join(link["texto"]).strip()})
+    if not parser.tabelas or not links:
+        return None
+
+    datas = [t for t in parser.celulas if len(t) == 10 and t[2] == "/" and t[5] == "/"]
+    return _resultado_por_espec(espec, datas, links)
+
+
+# ====== SNAPSHOTS DAS PÁGINAS ======
+# Cada página lida (HTML estático ou DOM renderizado no Chromium) fica gravada em
+# runtime/snapshots/<hash da URL>.json.gz. No modo "replay" a extração sai só daí,
+# sem navegador, e a execução só compara com o manifest (não o grava nem manda
+# e-mail): reprocessar o dia ou testar mudanças no extrator. Imagens, fontes e CSS não são
+# guardados (o extrator não usa e o carregamento enxuto já os bloqueia).
+SNAPSHOTS_DIR = BASE / "runtime" / "snapshots"
+
+class SnapshotIndisponivel(Exception):
+    """Modo replay sem snapshot (ou com snapshot vencido) para a página."""
+
+def _caminho_snapshot(url):
+    return SNAPSHOTS_DIR / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]}.json.gz"
+
+def gravar_snapshot(url, origem, html, url_final, headers=None, dados=None):
+    """Grava (ou substitui) o snapshot da página; falhas só viram aviso no log."""
+    if not GRAVAR_SNAPSHOTS:
+        return
+    import gzip
+    registro = {"url": url, "url_final": url_final, "origem": origem, "gravado_em": datetime.now().isoformat(),
+                "headers": headers or {}, "dados": dados, "html": html}
+    caminho = _caminho_snapshot(url)
+    tmp = caminho.with_name(f"{caminho.name}.{threading.get_ident()}.tmp")
+    try:
+        SNAPSHOTS_DIR.mkdir(parents=True, exist_ok=True)
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(registro, f, ensure_ascii=False)
+        os.replace(tmp, caminho)
+        metricas.contar("snapshots_gravados")
+    except Exception as e:
+        logger.warning(f"Falha ao gravar snapshot de {url}: {e}")
+        tmp.unlink(missing_ok=True)
+
+def renovar_snapshot(url):
+    """Página confirmada sem mudança (304/fingerprint): o snapshot atual continua valendo."""
+    caminho = _caminho_snapshot(url)
+    if GRAVAR_SNAPSHOTS and caminho.exists():
+        os.utime(caminho)
+
+def _snapshot_vencido(caminho, agora=None):
+    idade = (agora or time.time()) - caminho.stat().st_mtime
+    return idade > SNAPSHOT_TTL_H * 3600
+
+def ler_snapshot(url):
+    """Snapshot da página dentro do TTL, ou None."""
+    import gzip
+    caminho = _caminho_snapshot(url)
+    try:
+        if _snapshot_vencido(caminho):
+            return None
+        with gzip.open(caminho, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, EOFError, ValueError):
+        return None
+
+def extrair_de_snapshot(url):
+    """Extração do modo replay: o extrator atual aplicado ao HTML gravado."""
+    snap = ler_snapshot(url)
+    if snap is None:
+        raise SnapshotIndisponivel(f"sem snapshot válido (TTL {SNAPSHOT_TTL_H:g} h) para {url}")
+    metricas.contar("paginas_snapshot")
+    logger.info(f"Página lida do snapshot de {snap['gravado_em'][:19]} ({snap['origem']}): {url}")
+    res = _extrair_html_estatico(snap["html"], snap["url_final"], url)
+    if res is None and snap.get("dados"):
+        # DOM renderizado que o parser estático não reconhece: usa o que o Chromium extraiu
+        res = _resultado_por_espec(espec_da_pagina(url), snap["dados"]["datas"], snap["dados"]["links"])
+    return res if res is not None else ([], [], {})
+
+def limpar_snapshots():
+    """Apaga os snapshots vencidos."""
+    if not SNAPSHOTS_DIR.exists():
+        return 0
+    agora, apagados = time.time(), 0
+    for arq in SNAPSHOTS_DIR.glob("*.json.gz"):
+        try:
+            if _snapshot_vencido(arq, agora):
+                arq.unlink()
+                apagados += 1
+        except OSError:
+            pass
+    return apagados
+
+
+def extrair_datas_categorias_e_anexos(url, navegador=None, session=None, modo=None, cache_paginas=None):
+    modo = modo or MODO_EXTRACAO
+    if modo == "replay":
+        with metricas.span("pagina_snapshot", url):
+            return extrair_de_snapshot(url)
+    if modo != "playwright":
+        try:
+            with metricas.span("pagina_http", url):
+                res = extrair_pagina_http(session or _session(), url, cache_paginas)
+        except (PrazoEsgotado, HostIndisponivel):
+            raise  # o Chromium bateria no mesmo host/prazo
+        except Exception as e:
+            if modo == "http":
+                raise
+            logger.info(f"HTML estático indisponível para {url} ({e}); usando o Chromium")
+            res = None
+        if res is not None:
+            return res
+        if modo == "http":
+            return [], [], {}
+        logger.info(f"Página sem tabela/anexos no HTML estático, usando o Chromium: {url}")
+
+    metricas.contar("paginas_chromium")
+    with metricas.span("pagina_chromium", url):
+        if navegador is not None:
+            return navegador.submeter(url, cache_paginas).result()
+        with NavegadorCompartilhado(max_paginas=1) as nav:
+            return nav.submeter(url, cache_paginas).result()
+
+
+def extrair_paginas(urls_paginas, navegador, session=None, modo=None, ao_extrair=None):
+    """
+    Extrai todas as páginas em paralelo (até MAX_PAGINAS_SIMULTANEAS). O valor de
+    cada URL é a tupla (datas, anexos, categorias) ou a exceção da página.
+    `ao_extrair(url, resultado)` é chamada assim que cada página fica pronta.
+    """
+    session = session or _session()
+    modo = modo or MODO_EXTRACAO
+    # no replay o cache de páginas (304/fingerprint) não vale: tudo é extraído de novo
+    cache_paginas = None if modo == "replay" else _load_paginas_cache()
+
+    def _uma(u):
+        metricas.contar("paginas")
+        try:
+            if orcamento.esgotado(RESERVA_ENVIO_S):
+                raise PrazoEsgotado("prazo da execução esgotado")
+            res = extrair_datas_categorias_e_anexos(u, navegador, session, modo, cache_paginas)
+        except Exception as e:
+            metricas.contar("paginas_erro")
+            return e
+        if ao_extrair is not None:
+            try:
+                ao_extrair(u, res)
+            except Exception as e:
+                logger.warning(f"Falha ao encaminhar os anexos de {u}: {e}")
+        return res
+
+    with ThreadPoolExecutor(max_workers=max(1, MAX_PAGINAS_SIMULTANEAS)) as pool:
+        resultados = dict(zip(urls_paginas, pool.map(_uma, urls_paginas)))
+    adiadas = [u for u, r in resultados.items() if isinstance(r, (PrazoEsgotado, HostIndisponivel))]
+    if adiadas:
+        orcamento.registrar_motivo(f"{len(adiadas)} página(s) não lida(s) a tempo, ficam para a próxima execução")
+    if cache_paginas is not None:
+        try:
+            _save_paginas_cache(cache_paginas)
+        except Exception as e:
+            logger.warning(f"Falha ao gravar cache de páginas: {e}")
+        limpar_snapshots()
+    return resultados
 
 
 # ====== EMAIL HTML ======
@@ -376,36 +2229,280 @@ def nome_doc_por_url(url):
     return "Desconhecido"
 
 
-# ====== DOWNLOAD P/ ANEXO ======
-def baixar_para_anexo(session, url, max_single=MAX_SINGLE_ATTACH_SIZE):
-    try:
-        hi = head_info(session, url)
-        cl = hi.get("content_length")
-        if cl and cl.isdigit() and int(cl) > max_single:
-            return None, None, None, f"pula: Content-Length {cl} > limite"
-    except Exception:
-        pass
+# ====== CACHE DE ANEXOS ======
+# Armazenamento endereçado por conteúdo: objetos/<sha256[:2]>/<sha256>, com um índice
+# (url + ETag/Last-Modified -> sha256) e remoção LRU, ao fim da execução, quando passa de
+# CACHE_ANEXOS_MAX_BYTES.
+RUNTIME_DIR = BASE / "runtime"
+CACHE_ANEXOS_DIR = RUNTIME_DIR / "anexos_cache"
+CACHE_ANEXOS_MAX_BYTES = int(os.environ.get("MONITOR_CACHE_ANEXOS_MB", "256")) * 1024 * 1024
+
+_SCHEMA_CACHE = """
+CREATE TABLE IF NOT EXISTS objetos (
+    sha256        TEXT PRIMARY KEY,
+    tamanho       INTEGER NOT NULL,
+    ultimo_acesso TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_objetos_acesso ON objetos(ultimo_acesso);
+CREATE TABLE IF NOT EXISTS indice (
+    url           TEXT NOT NULL,
+    etag          TEXT NOT NULL,
+    last_modified TEXT NOT NULL,
+    final_url     TEXT,
+    sha256        TEXT NOT NULL,
+    gravado_em    TEXT NOT NULL,
+    PRIMARY KEY (url, etag, last_modified)
+);
+CREATE INDEX IF NOT EXISTS idx_indice_sha ON indice(sha256);
+"""
 
-    r = session.get(url, stream=True, allow_redirects=True, timeout=TIMEOUT)
-    if r.status_code != 200:
-        return None, None, None, f"status {r.status_code}"
+def _cache_db():
+    CACHE_ANEXOS_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(CACHE_ANEXOS_DIR / "indice.sqlite3", timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA_CACHE)
+    return conn
+
+def _cache_caminho(sha256):
+    return CACHE_ANEXOS_DIR / "objetos" / sha256[:2] / sha256
+
+def cache_obter(conn, url, etag, last_modified):
+    """Objeto em cache para a versão (ETag/Last-Modified) do anexo: (caminho, sha256, final_url) ou None."""
+    if not (etag or last_modified):
+        return None
+    row = conn.execute(
+        "SELECT sha256, final_url FROM indice WHERE url = ? AND etag = ? AND last_modified = ?",
+        (url, etag or "", last_modified or "")).fetchone()
+    if not row or not _cache_caminho(row["sha256"]).exists():
+        return None
+    with conn:
+        conn.execute("UPDATE objetos SET ultimo_acesso = ? WHERE sha256 = ?",
+                     (datetime.now().isoformat(), row["sha256"]))
+    return _cache_caminho(row["sha256"]), row["sha256"], row["final_url"]
+
+def cache_gravar(conn, url, etag, last_modified, final_url, chunks, max_bytes=None):
+    """
+    Grava o conteúdo (iterável de bytes) no cache. Devolve (caminho, sha256, tamanho),
+    ou None se passar de `max_bytes` (nada fica gravado nesse caso).
+    """
+    tmp_dir = CACHE_ANEXOS_DIR / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_dir / f"{os.getpid()}_{threading.get_ident()}_{hashlib.sha1(url.encode()).hexdigest()}"
+    h, total = hashlib.sha256(), 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                if not chunk: continue
+                total += len(chunk)
+                if max_bytes is not None and total > max_bytes:
+                    return None
+                h.update(chunk)
+                f.write(chunk)
+        sha = h.hexdigest()
+        destino = _cache_caminho(sha)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, destino)
+    finally:
+        if tmp.exists(): tmp.unlink()
+
+    agora = datetime.now().isoformat()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO objetos (sha256, tamanho, ultimo_acesso) VALUES (?, ?, ?)",
+                     (sha, total, agora))
+        if etag or last_modified:
+            conn.execute("INSERT OR REPLACE INTO indice (url, etag, last_modified, final_url, sha256, gravado_em) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (url, etag or "", last_modified or "", final_url, sha, agora))
+    return destino, sha, total
+
+def _cache_limpar(conn, max_bytes=None):
+    """
+    Remove os objetos usados há mais tempo até o cache caber em `max_bytes`. Roda uma vez
+    por execução, depois que o e-mail foi montado: no meio dos downloads poderia apagar
+    um anexo desta execução antes de ele ser compactado ou copiado para o .eml.
+    """
+    max_bytes = CACHE_ANEXOS_MAX_BYTES if max_bytes is None else max_bytes
+    total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM objetos").fetchone()[0]
+    if total <= max_bytes:
+        return
+    for row in conn.execute("SELECT sha256, tamanho FROM objetos ORDER BY ultimo_acesso").fetchall():
+        if total <= max_bytes:
+            break
+        with conn:
+            conn.execute("DELETE FROM indice WHERE sha256 = ?", (row["sha256"],))
+            conn.execute("DELETE FROM objetos WHERE sha256 = ?", (row["sha256"],))
+        try: _cache_caminho(row["sha256"]).unlink()
+        except FileNotFoundError: pass
+        total -= row["tamanho"]
 
-    data, total = bytearray(), 0
-    for chunk in r.iter_content(64 * 1024):
-        if not chunk: break
-        data.extend(chunk); total += len(chunk)
-        if total > max_single:
-            return None, None, None, f"pula: excedeu {max_single} bytes"
-    content = bytes(data)
 
-    filename = _filename_from_url(r.url or url)
+# ====== DOWNLOAD P/ ANEXO ======
+def _tipo_mime(filename):
     ctype, _ = mimetypes.guess_type(filename)
     if not ctype: ctype = "application/octet-stream"
-    maintype, subtype = ctype.split("/", 1)
-    return content, maintype, subtype, None
+    return ctype.split("/", 1)
+
+def baixar_para_anexo(session, url, info=None, cache=None, max_single=None):
+    """
+    Anexo para o e-mail, gravado em disco no cache (nunca inteiro em memória). `info`
+    é o resultado do HEAD da fase de checagem (entrada do manifest), reaproveitado em
+    vez de um HEAD novo; uma versão já baixada não é baixada de novo. Sem `max_single`,
+    o teto é MAX_DOWNLOAD_ANEXO (o arquivo ainda vai ser compactado) ou, sem a
+    compactação, MAX_SINGLE_ATTACH_SIZE.
+    Devolve (caminho, maintype, subtype, motivo, sha256).
+    """
+    if max_single is None:
+        max_single = MAX_DOWNLOAD_ANEXO if COMPACTAR_ANEXOS else MAX_SINGLE_ATTACH_SIZE
+    if info is None:
+        try: info = head_info(session, url)
+        except Exception: info = {}
+    cl = info.get("content_length")
+    if cl and cl.isdigit() and int(cl) > max_single:
+        return None, None, None, f"pula: Content-Length {cl} > limite", None
+
+    fechar = cache is None
+    cache = cache or _cache_db()
+    try:
+        etag, lm = info.get("etag"), info.get("last_modified")
+        hit = cache_obter(cache, url, etag, lm)
+        if hit:
+            caminho, sha, final_url = hit
+            metricas.contar("cache_hits")
+            logger.info(f"Anexo reaproveitado do cache: {_filename_from_url(url)}")
+            maintype, subtype = _tipo_mime(_filename_from_url(final_url or url))
+            return caminho, maintype, subtype, None, sha
+
+        r = session.get(url, stream=True, allow_redirects=True, timeout=TIMEOUT)
+        if r.status_code != 200:
+            return None, None, None, f"status {r.status_code}", None
+
+        gravado = cache_gravar(cache, url, r.headers.get("ETag") or etag, r.headers.get("Last-Modified") or lm,
+                               r.url, r.iter_content(64 * 1024), max_bytes=max_single)
+        if gravado is None:
+            return None, None, None, f"pula: excedeu {max_single} bytes", None
+        caminho, sha, total = gravado
+        metricas.contar("downloads")
+        metricas.contar("bytes_baixados", total)
+        maintype, subtype = _tipo_mime(_filename_from_url(r.url or url))
+        return caminho, maintype, subtype, None, sha
+    finally:
+        if fechar: cache.close()
+
+
+# ====== EMPACOTAMENTO DOS ANEXOS ======
+# XSD, XML e planilhas comprimem bem e o base64 ainda soma ~33% ao e-mail: os anexos
+# alterados vão em ZIPs montados em disco (ZipFile.write lê o arquivo em blocos),
+# divididos em partes quando passam de MAX_SINGLE_ATTACH_SIZE.
+ZIP_NIVEL = 6  # o mesmo nível na medição e na escrita: o tamanho medido é o do ZIP
+_EXTENSOES_JA_COMPRIMIDAS = {".zip", ".gz", ".7z", ".rar", ".xlsx", ".docx", ".pptx",
+                             ".jpg", ".jpeg", ".png"}
+_ZIP_SOBRA_ENTRADA = 160  # cabeçalho local + diretório central (com zip64) por arquivo, fora o nome
+_ZIP_SOBRA_ARQUIVO = 64   # registro de fim do diretório central
+
+def _ja_comprimido(nome):
+    return Path(nome).suffix.lower() in _EXTENSOES_JA_COMPRIMIDAS
+
+def _tamanho_no_zip(caminho, nome):
+    """Bytes que o arquivo ocupa dentro do ZIP, comprimindo em blocos sem gravar nada."""
+    import zlib
+    if _ja_comprimido(nome):
+        dados = Path(caminho).stat().st_size
+    else:
+        comp, dados = zlib.compressobj(ZIP_NIVEL, zlib.DEFLATED, -15), 0
+        with open(caminho, "rb") as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                dados += len(comp.compress(bloco))
+        dados += len(comp.flush())
+    return dados + _ZIP_SOBRA_ENTRADA + 2 * len(nome.encode("utf-8"))
+
+def _nomes_unicos(nomes):
+    """Nomes dentro do ZIP sem colisão (o mesmo arquivo publicado em duas pastas)."""
+    vistos, unicos = set(), []
+    for nome in nomes:
+        base, ext = os.path.splitext(nome)
+        candidato, n = nome, 2
+        while candidato.lower() in vistos:
+            candidato, n = f"{base}_{n}{ext}", n + 1
+        vistos.add(candidato.lower())
+        unicos.append(candidato)
+    return unicos
+
+def _sem_compactar(arquivos, max_parte, max_total):
+    """Anexos crus, como antes da compactação: o que passa dos limites fica só no link."""
+    anexos, so_link, total = [], [], 0
+    for caminho, maintype, subtype, nome, url in arquivos:
+        tamanho = Path(caminho).stat().st_size
+        if tamanho > max_parte or total + tamanho > max_total:
+            so_link.append(url)
+            continue
+        anexos.append((Path(caminho), maintype, subtype, nome))
+        total += tamanho
+    return anexos, so_link, []
+
+def empacotar_anexos(arquivos, prefixo="leiautes_alterados",
+                     max_parte=MAX_SINGLE_ATTACH_SIZE, max_total=MAX_TOTAL_ATTACH_SIZE):
+    """
+    `arquivos`: [(caminho, maintype, subtype, nome, url)] na ordem do e-mail.
+    Devolve (anexos, so_link, temporarios): os anexos no formato de
+    montar_email_em_arquivo, as URLs que não couberam (seguem só como link) e os ZIPs
+    gravados em EMAIL_TMP_DIR, a apagar depois da montagem do e-mail.
+    Cada arquivo entra na primeira parte com espaço; quando tudo cabe cru numa parte,
+    a medição é dispensada.
+    """
+    if not COMPACTAR_ANEXOS:
+        return _sem_compactar(arquivos, max_parte, max_total)
+    if not arquivos:
+        return [], [], []
+    nomes = _nomes_unicos([a[3] for a in arquivos])
+    brutos = [Path(a[0]).stat().st_size + _ZIP_SOBRA_ENTRADA + 2 * len(n.encode("utf-8"))
+              for a, n in zip(arquivos, nomes)]
+
+    so_link = []
+    # deflate num arquivo incompressível cresce uns poucos bytes a cada bloco: 1% de folga
+    if sum(brutos) * 1.01 + _ZIP_SOBRA_ARQUIVO <= min(max_parte, max_total):
+        partes = [list(range(len(arquivos)))]
+    else:
+        partes, ocupado, total = [], [], 0
+        for i, (caminho, _, _, _, url) in enumerate(arquivos):
+            tamanho = _tamanho_no_zip(caminho, nomes[i])
+            if tamanho + _ZIP_SOBRA_ARQUIVO > max_parte or total + tamanho > max_total:
+                so_link.append(url)
+                continue
+            for j, usado in enumerate(ocupado):
+                if usado + tamanho + _ZIP_SOBRA_ARQUIVO <= max_parte:
+                    partes[j].append(i)
+                    ocupado[j] += tamanho
+                    break
+            else:
+                partes.append([i])
+                ocupado.append(tamanho)
+            total += tamanho
+
+    import zipfile
+    EMAIL_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    anexos, temporarios = [], []
+    try:
+        for n, parte in enumerate(partes, 1):
+            fd, tmp = tempfile.mkstemp(prefix="anexos_", suffix=".zip", dir=EMAIL_TMP_DIR)
+            os.close(fd)
+            temporarios.append(Path(tmp))
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=ZIP_NIVEL) as zf:
+                for i in parte:
+                    tipo = zipfile.ZIP_STORED if _ja_comprimido(nomes[i]) else zipfile.ZIP_DEFLATED
+                    zf.write(arquivos[i][0], nomes[i], compress_type=tipo)
+            nome_zip = f"{prefixo}.zip" if len(partes) == 1 else f"{prefixo}_parte{n}de{len(partes)}.zip"
+            anexos.append((Path(tmp), "application", "zip", nome_zip))
+    except BaseException:
+        for tmp in temporarios:
+            tmp.unlink(missing_ok=True)
+        raise
+    metricas.contar("bytes_anexos_brutos", sum(Path(arquivos[i][0]).stat().st_size for p in partes for i in p))
+    metricas.contar("bytes_anexos_zip", sum(t.stat().st_size for t in temporarios))
+    return anexos, so_link, temporarios
 
 
 # ====== CONFIG DE E-MAIL ======
+DESTINATARIOS = None  # sobrepõe o "to" do config_email.json (definido por projeto)
+
 def load_email_config(path: Path):
     cfg = json.loads(path.read_text(encoding="utf-8"))
     to = cfg.get("to") or cfg.get("destinatarios") or []
@@ -424,53 +2521,524 @@ def load_email_config(path: Path):
     }
 
 
+# ====== MONTAGEM/ENVIO DO E-MAIL EM DISCO ======
+# A mensagem é escrita num .eml em runtime/tmp, com os anexos codificados em base64
+# em blocos, e enviada por um DATA em streaming: o uso de memória não depende do
+# tamanho dos anexos.
+EMAIL_TMP_DIR = RUNTIME_DIR / "tmp"
+_BLOCO_BASE64 = 57 * 1024  # múltiplo de 57 bytes -> linhas completas de 76 caracteres
+
+def _cabecalhos_mime(parte):
+    """Só o bloco de cabeçalhos (com a linha em branco final) de uma parte MIME."""
+    from email import policy as email_policy
+    bruto = parte.as_bytes(policy=email_policy.SMTP)
+    return bruto[:bruto.index(b"\r\n\r\n") + 4]
+
+def montar_email_em_arquivo(assunto, remetente, destinatarios, html, logo_path, logo_cid, anexos):
+    """
+    Grava a mensagem multipart num arquivo temporário e devolve o caminho.
+    `anexos` é uma lista de (caminho, maintype, subtype, filename).
+    """
+    from email.mime.text import MIMEText
+    from email.mime.image import MIMEImage
+    from email.mime.base import MIMEBase
+    from email.message import EmailMessage
+    from email.utils import make_msgid, formatdate
+    from email import policy as email_policy
+
+    EMAIL_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    boundary = f"===============monitor{make_msgid()[1:-1].split('@')[0].replace('.', '')}=="
+
+    topo = EmailMessage(policy=email_policy.SMTP)
+    topo["Subject"] = assunto
+    topo["From"] = remetente
+    topo["To"] = ", ".join(destinatarios)
+    topo["Date"] = formatdate(localtime=True)
+    topo["Message-ID"] = make_msgid(domain="finaud.com.br")
+    topo["MIME-Version"] = "1.0"
+    topo["Content-Type"] = f'multipart/mixed; boundary="{boundary}"'
+
+    separador = f"--{boundary}\r\n".encode("ascii")
+    fd, nome = tempfile.mkstemp(prefix="email_", suffix=".eml", dir=EMAIL_TMP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(_cabecalhos_mime(topo))
+
+            out.write(separador)
+            out.write(MIMEText(html, "html", "utf-8").as_bytes(policy=email_policy.SMTP))
+            out.write(b"\r\n")
+
+            with open(logo_path, "rb") as f:
+                img = MIMEImage(f.read())
+            img.add_header("Content-ID", f"<{logo_cid}>")
+            img.add_header("Content-Disposition", "inline", filename="logo.jpg")
+            out.write(separador)
+            out.write(img.as_bytes(policy=email_policy.SMTP))
+            out.write(b"\r\n")
+
+            for caminho, maintype, subtype, filename in anexos:
+                parte = MIMEBase(maintype, subtype)
+                parte["Content-Transfer-Encoding"] = "base64"
+                parte.add_header("Content-Disposition", "attachment", filename=filename)
+                out.write(separador)
+                out.write(_cabecalhos_mime(parte))
+                with open(caminho, "rb") as f:
+                    while True:
+                        bloco = f.read(_BLOCO_BASE64)
+                        if not bloco: break
+                        out.write(base64.encodebytes(bloco).replace(b"\n", b"\r\n"))
+
+            out.write(f"--{boundary}--\r\n".encode("ascii"))
+    except BaseException:
+        os.unlink(nome)
+        raise
+    return Path(nome)
+
+def _smtp_enviar_arquivo(server, remetente, destinatarios, caminho, bloco=64 * 1024):
+    """
+    Equivalente a server.sendmail() para uma mensagem já gravada em disco (CRLF),
+    enviada em blocos com dot-stuffing. Devolve os destinatários recusados.
+    """
+    import smtplib
+    server.ehlo_or_helo_if_needed()
+    code, resp = server.mail(remetente)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, resp, remetente)
+    recusados = {}
+    for rcpt in destinatarios:
+        code, resp = server.rcpt(rcpt)
+        if code not in (250, 251):
+            recusados[rcpt] = (code, resp)
+    if len(recusados) == len(destinatarios):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(recusados)
+
+    code, resp = server.docmd("DATA")
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, resp)
+    buf = bytearray()
+    with open(caminho, "rb") as f:
+        for linha in f:
+            if linha.startswith(b"."):
+                buf += b"."
+            buf += linha
+            if len(buf) >= bloco:
+                server.send(bytes(buf)); buf.clear()
+    if not buf.endswith(b"\r\n") and buf:
+        buf += b"\r\n"
+    buf += b".\r\n"
+    server.send(bytes(buf))
+    code, resp = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+    return recusados
+
+
+# ====== FILA DE SAÍDA (OUTBOX) ======
+# Cada e-mail montado vai para runtime/outbox (<id>.eml + <id>.json) antes do envio.
+# O envio reaproveita uma conexão autenticada por servidor para todas as mensagens e
+# grupos de destinatários, tenta de novo com backoff e o que sobrar é reenviado na
+# próxima execução, sem remontar a mensagem. Nenhuma senha é gravada: o .json guarda
+# só o caminho da configuração de e-mail.
+OUTBOX_DIR = RUNTIME_DIR / "outbox"
+SMTP_MAX_DESTINATARIOS = 50          # destinatários por envelope (RCPT TO)
+SMTP_TENTATIVAS_POR_EXECUCAO = 3
+SMTP_BACKOFF_S = 2.0
+SMTP_MAX_TENTATIVAS = 20             # depois disso a mensagem vai para outbox/falhas
+SMTP_TIMEOUT_S = 60
+
+def _smtp_conectar(cfg):
+    import smtplib
+    smtp_class = smtplib.SMTP_SSL if cfg["ssl"] else smtplib.SMTP
+    server = smtp_class(cfg["host"], cfg["port"], timeout=SMTP_TIMEOUT_S)
+    try:
+        if cfg["tls"]:
+            server.starttls()
+        if cfg["user"] and cfg["password"]:
+            server.login(cfg["user"], cfg["password"])
+    except BaseException:
+        # STARTTLS/AUTH recusados (ex.: SMTPNotSupportedError): a conexão não fica aberta
+        _smtp_fechar(server)
+        raise
+    return server
+
+def _smtp_fechar(server):
+    try: server.quit()
+    except Exception:
+        try: server.close()
+        except Exception: pass
+
+def _outbox_gravar_meta(meta):
+    caminho = OUTBOX_DIR / f"{meta['id']}.json"
+    tmp = caminho.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(meta, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, caminho)
+
+def enfileirar_email(eml, remetente, destinatarios, config_path):
+    """Move o .eml montado para a outbox e devolve o id da mensagem."""
+    OUTBOX_DIR.mkdir(parents=True, exist_ok=True)
+    id_msg = f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}"
+    os.replace(eml, OUTBOX_DIR / f"{id_msg}.eml")
+    grupos = [destinatarios[i:i + SMTP_MAX_DESTINATARIOS]
+              for i in range(0, len(destinatarios), SMTP_MAX_DESTINATARIOS)]
+    _outbox_gravar_meta({
+        "id": id_msg,
+        "from": remetente,
+        "pendentes": grupos,
+        "config": str(config_path),
+        "criado_em": datetime.now().isoformat(),
+        "tentativas": 0,
+        "proxima_tentativa": None,
+        "ultimo_erro": None,
+    })
+    return id_msg
+
+def _outbox_pendentes():
+    if not OUTBOX_DIR.exists():
+        return []
+    agora = datetime.now().isoformat()
+    metas = []
+    for arq in sorted(OUTBOX_DIR.glob("*.json")):
+        try:
+            meta = json.loads(arq.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"Outbox: metadados ilegíveis em {arq.name}: {e}")
+            continue
+        if (meta.get("proxima_tentativa") or "") <= agora:
+            metas.append(meta)
+    return metas
+
+def _outbox_descartar(meta, falha=False):
+    eml = OUTBOX_DIR / f"{meta['id']}.eml"
+    js = OUTBOX_DIR / f"{meta['id']}.json"
+    if falha:
+        destino = OUTBOX_DIR / "falhas"
+        destino.mkdir(exist_ok=True)
+        for arq in (eml, js):
+            if arq.exists(): os.replace(arq, destino / arq.name)
+    else:
+        eml.unlink(missing_ok=True)
+        js.unlink(missing_ok=True)
+
+def enviar_outbox():
+    """
+    Envia o que estiver pendente na outbox. Devolve os ids das mensagens entregues
+    (todas as partes) nesta chamada.
+    """
+    import smtplib
+    entregues = []
+    conexoes = {}
+    configs = {}
+    try:
+        for meta in _outbox_pendentes():
+            eml = OUTBOX_DIR / f"{meta['id']}.eml"
+            if not eml.exists():
+                logger.warning(f"Outbox: {meta['id']}.eml não encontrado; descartando")
+                _outbox_descartar(meta)
+                continue
+            try:
+                cfg = configs.get(meta["config"]) or load_email_config(Path(meta["config"]))
+                configs[meta["config"]] = cfg
+            except Exception as e:
+                logger.error(f"Outbox: configuração de e-mail inválida para {meta['id']}: {e}")
+                continue
+            chave = (cfg["host"], cfg["port"], cfg["user"])
+
+            while meta["pendentes"]:
+                grupo = meta["pendentes"][0]
+                erro, permanente, recusado = None, False, False
+                for tentativa in range(SMTP_TENTATIVAS_POR_EXECUCAO):
+                    try:
+                        if chave not in conexoes:
+                            conexoes[chave] = _smtp_conectar(cfg)
+                            metricas.contar("smtp_conexoes")
+                        recusados = _smtp_enviar_arquivo(conexoes[chave], meta["from"], grupo, eml)
+                        for rcpt, (code, resp) in recusados.items():
+                            logger.warning(f"Destinatário recusado ({code}): {rcpt}")
+                        erro = None
+                        break
+                    except smtplib.SMTPRecipientsRefused as e:
+                        logger.error(f"Outbox: todos os destinatários recusados em {meta['id']}: {e.recipients}")
+                        recusado = True  # permanente: não adianta reenviar este grupo
+                        break
+                    except (smtplib.SMTPException, OSError) as e:
+                        # SMTPException cobre também SMTPNotSupportedError (sem STARTTLS/AUTH)
+                        # e os erros sem código do login(): tratados como transitórios
+                        erro = e
+                        if chave in conexoes:
+                            _smtp_fechar(conexoes.pop(chave))
+                        if isinstance(e, smtplib.SMTPResponseException) and 500 <= e.smtp_code < 600 \
+                                and not isinstance(e, smtplib.SMTPAuthenticationError):
+                            permanente = True  # o servidor rejeitou a mensagem: não adianta insistir
+                            break
+                        if tentativa + 1 < SMTP_TENTATIVAS_POR_EXECUCAO:
+                            espera = SMTP_BACKOFF_S * (2 ** tentativa)
+                            if orcamento.restante() < espera:
+                                # sem prazo para esperar: a mensagem fica na outbox para a próxima execução
+                                logger.warning(f"Falha no envio SMTP ({e}); sem prazo para nova tentativa")
+                                break
+                            metricas.contar("smtp_novas_tentativas")
+                            logger.warning(f"Falha no envio SMTP ({e}); nova tentativa em {espera:g}s")
+                            time.sleep(espera)
+                if erro is not None:
+                    break
+                meta["pendentes"].pop(0)
+                if recusado:
+                    meta.setdefault("recusados", []).append(grupo)
+                _outbox_gravar_meta(meta)
+
+            if not meta["pendentes"] and meta.get("recusados"):
+                meta["ultimo_erro"] = f"destinatários recusados: {', '.join(sum(meta['recusados'], []))}"
+                _outbox_gravar_meta(meta)
+                logger.error(f"Outbox: {meta['id']} não entregue a todos ({meta['ultimo_erro']}); "
+                             f"movido para outbox/falhas")
+                _outbox_descartar(meta, falha=True)
+                continue
+            if not meta["pendentes"]:
+                _outbox_descartar(meta)
+                entregues.append(meta["id"])
+                metricas.contar("emails_entregues")
+                continue
+
+            meta["tentativas"] += 1
+            meta["ultimo_erro"] = str(erro)
+            if permanente or meta["tentativas"] >= SMTP_MAX_TENTATIVAS:
+                logger.error(f"Outbox: {meta['id']} desistiu após {meta['tentativas']} tentativas: {erro}")
+                _outbox_descartar(meta, falha=True)
+                continue
+            espera = min(3600, 60 * 2 ** (meta["tentativas"] - 1))
+            meta["proxima_tentativa"] = (datetime.now() + timedelta(seconds=espera)).isoformat()
+            _outbox_gravar_meta(meta)
+            logger.error(f"Erro ao enviar e-mail {meta['id']}: {erro} (fica na outbox, "
+                         f"tentativa {meta['tentativas']}/{SMTP_MAX_TENTATIVAS})")
+    finally:
+        for server in conexoes.values():
+            _smtp_fechar(server)
+    return entregues
+
+
 # ===== DEFINIÇÃO DA MAIN =====
-def main():
+def main(urls_paginas=None, navegador=None, session=None, anexos_conhecidos=None,
+         filtrar_anexos=None, enviar_sem_novidade=None, enviar=True):
+    """
+    Uma rodada de monitoração. Os parâmetros existem para o modo daemon e para o
+    multiprojeto, que reaproveitam navegador/sessão e checam só o que está na hora:
+    - urls_paginas: páginas a extrair (padrão: todas)
+    - anexos_conhecidos: {url: categoria} de páginas não extraídas nesta rodada
+    - filtrar_anexos: função url -> bool que escolhe quais anexos checar
+    - enviar_sem_novidade: sobrepõe SEND_EMAIL_WHEN_NO_CHANGES
+    - enviar: False só enfileira o e-mail (quem chamou esvazia a outbox depois)
+    Tudo dentro do prazo da execução (PRAZO_EXECUCAO_S); o que não couber fica para
+    a próxima e o motivo vai em "motivos_parciais".
+    """
+    with orcamento.execucao():
+        return _rodada(urls_paginas, navegador, session, anexos_conhecidos,
+                       filtrar_anexos, enviar_sem_novidade, enviar)
+
+def _rodada(urls_paginas, navegador, session, anexos_conhecidos, filtrar_anexos,
+            enviar_sem_novidade, enviar):
     logger.info("Iniciando monitoração...")
+    # diário (checkpoints/retomada) só nas execuções completas; o daemon escolhe o que checar
+    # e o replay não grava nada
+    usar_diario = urls_paginas is None and MODO_EXTRACAO != "replay"
+    urls_paginas = urls if urls_paginas is None else urls_paginas
+    enviar_sem_novidade = SEND_EMAIL_WHEN_NO_CHANGES if enviar_sem_novidade is None else enviar_sem_novidade
+    session = session or _session()
+    with DiarioExecucao() if usar_diario else nullcontext() as diario:
+        return _rodada_com_diario(urls_paginas, navegador, session, anexos_conhecidos, filtrar_anexos,
+                                  enviar_sem_novidade, enviar, diario)
+
+def _rodada_com_diario(urls_paginas, navegador, session, anexos_conhecidos, filtrar_anexos,
+                       enviar_sem_novidade, enviar, diario):
+    paginas_prontas, ja_checados = {}, {}
+    if diario is not None:
+        paginas_prontas = {u: tuple(r) for u, r in diario.entradas("pagina").items() if u in urls_paginas}
+        ja_checados = diario.entradas("anexo")
+        if diario.retomada:
+            logger.info(f"Retomando a execução {diario.id}: {_plural(len(paginas_prontas), 'página')} e "
+                        f"{_plural(len(ja_checados), 'anexo')} já feitos")
+
+    # anexos vão para a checagem (e os alterados para o download) à medida que
+    # cada página é extraída; o resultado é montado depois, na ordem das páginas
+    conn = _manifest_db()
+    try:
+        manifest = _load_manifest(conn)
+        indice = IndiceUrls(conn, manifest)
+    finally:
+        conn.close()
+    anexos_conhecidos = {indice.documento(u): c for u, c in (anexos_conhecidos or {}).items()}
+
+    # no replay nenhum anexo vai para a fila: só os links são comparados com o manifest
+    replay = MODO_EXTRACAO == "replay"
+    with PipelineAnexos(session, manifest=manifest, baixar=not replay and _ha_destinatarios(),
+                        ignorar=ja_checados) as pipeline:
+        if not replay:
+            pipeline.adicionar([u for u in anexos_conhecidos if filtrar_anexos is None or filtrar_anexos(u)])
+
+        def _pagina_pronta(url, res):
+            if diario is not None:
+                diario.registrar("pagina", url, res)
+            # o filtro do daemon consulta a agenda (SQLite da thread principal): com
+            # ele, os anexos das páginas só entram na fila em verificar_anexos
+            if filtrar_anexos is None and not replay:
+                datas, anexos, _ = res
+                docs = [indice.documento(u) for u in anexos]
+                pipeline.adicionar(docs, docs if hoje in datas else ())
+
+        for url, res in paginas_prontas.items():
+            _pagina_pronta(url, res)
+        a_extrair = [u for u in urls_paginas if u not in paginas_prontas]
+        with metricas.span("paginas"):
+            if navegador is None:
+                with NavegadorCompartilhado() as navegador:
+                    extraidas = extrair_paginas(a_extrair, navegador, session, ao_extrair=_pagina_pronta)
+            else:
+                extraidas = extrair_paginas(a_extrair, navegador, session, ao_extrair=_pagina_pronta)
+        resultados = {u: paginas_prontas[u] if u in paginas_prontas else extraidas.get(u) for u in urls_paginas}
+        return _rodada_resultado(urls_paginas, resultados, session, pipeline, indice, anexos_conhecidos,
+                                 filtrar_anexos, enviar_sem_novidade, enviar, diario)
+
+def _ha_destinatarios():
+    """Vale antecipar downloads? (só se houver para quem mandar o e-mail)"""
+    if DESTINATARIOS:
+        return True
+    try:
+        return bool(load_email_config(CONFIG_PATH).get("to"))
+    except Exception:
+        return False
 
+def _rodada_resultado(urls_paginas, resultados, session, pipeline, indice, anexos_conhecidos, filtrar_anexos,
+                      enviar_sem_novidade, enviar, diario):
+    replay = MODO_EXTRACAO == "replay"  # só compara os links com o manifest: não grava nem manda e-mail
     anexos_detectados = []
-    categoria_por_url = {}
+    categorias_por_doc = {}  # documento -> categorias em que ele aparece, na ordem das páginas
     links_detectados_por_data = []
+    prioritarios = set()
 
-    for url in urls:
-        try:
-            datas, anexos, categorias = extrair_datas_categorias_e_anexos(url)
-            if hoje in datas:
-                links_detectados_por_data.append(url)
-            for link in anexos:
-                anexos_detectados.append(link)
-                categoria_por_url[link] = categorias.get(link, "Sem categoria")
-        except Exception as e:
-            logger.warning(f"Erro ao processar URL {url}: {e}")
+    for url in urls_paginas:
+        res = resultados.get(url)
+        if isinstance(res, Exception):
+            logger.warning(f"Erro ao processar URL {url}: {res}")
             continue
-
-    alterados, manifest = verificar_anexos(anexos_detectados)
+        datas, anexos, categorias = res
+        docs = [indice.documento(link) for link in anexos]
+        if hoje in datas:
+            links_detectados_por_data.append(url)
+            prioritarios.update(docs)
+        for link, doc in zip(anexos, docs):
+            if doc not in categorias_por_doc:
+                anexos_detectados.append(doc)
+                categorias_por_doc[doc] = []
+            categoria = categorias.get(link, "Sem categoria")
+            if categoria not in categorias_por_doc[doc]:
+                categorias_por_doc[doc].append(categoria)
+
+    for link, categoria in anexos_conhecidos.items():
+        if link not in categorias_por_doc:
+            anexos_detectados.append(link)
+            categorias_por_doc[link] = [categoria]
+    categoria_por_url = {doc: " / ".join([c for c in cats if c != "Sem categoria"] or cats)
+                         for doc, cats in categorias_por_doc.items()}
+    if filtrar_anexos is not None:
+        anexos_detectados = [u for u in anexos_detectados if filtrar_anexos(u)]
+
+    anexos_ausentes = []
+    if replay:
+        alterados, anexos_ausentes = comparar_com_manifest(anexos_detectados)
+        anexos_checados = {}
+    else:
+        with metricas.span("checagem_anexos"):
+            alterados, manifest = verificar_anexos(anexos_detectados, session=session, prioritarios=prioritarios,
+                                                   pipeline=pipeline, diario=diario)
+        # {url: erro (None se respondeu)} dos anexos de fato consultados; os que o prazo ou
+        # um host em pausa deixaram de fora não estão aqui
+        anexos_checados = {u: erro for u, (_, erro) in pipeline.consultas().items()}
     anexos_nomes = [_filename_from_url(a["url"]) for a in alterados]
 
     emails_enviados = 0
     destinatarios = []
-
-    if alterados or SEND_EMAIL_WHEN_NO_CHANGES:
+    id_email = None
+    email_anterior = diario.entradas("email").get("outbox") if diario is not None else None
+
+    if replay:
+        logger.info(f"Modo replay (anexos não checados): {_plural(len(alterados), 'documento novo', 'documentos novos')} "
+                    f"e {_plural(len(anexos_ausentes), 'documento', 'documentos')} do manifest fora das páginas; "
+                    f"nada é gravado e nenhum e-mail é montado nem enviado")
+        for u in alterados:
+            logger.info(f"Replay: documento novo: {u['url']}")
+        for u in anexos_ausentes[:20]:
+            logger.info(f"Replay: fora das páginas: {u}")
+    elif email_anterior:
+        # a tentativa anterior já deixou o e-mail na outbox; só falta entregá-lo
+        id_email, destinatarios = email_anterior["id_email"], email_anterior["destinatarios"]
+        logger.info(f"E-mail desta execução já está na outbox ({id_email}); não é montado de novo")
+    elif alterados or enviar_sem_novidade:
         email_cfg = load_email_config(CONFIG_PATH)
-        destinatarios = email_cfg.get("to", [])
+        destinatarios = DESTINATARIOS or email_cfg.get("to", [])
         if not destinatarios:
             logger.warning("Nenhum destinatário definido para envio.")
         else:
-            msg = MIMEMultipart()
-            msg["Subject"] = ASSUNTO
-            msg["From"] = email_cfg["from"]
-            msg["To"] = ", ".join(destinatarios)
-
+            from email.utils import make_msgid
             logo_cid = make_msgid(domain="finaud.com.br")[1:-1]
 
+            cache = _cache_db()
+            conn_manifest = _manifest_db()
+            baixados = []
+            sem_download = 0
+            baixados_antes = diario.entradas("download") if diario is not None else {}
+            with metricas.span("downloads"):
+                for item in alterados:
+                    url = item["url"]
+                    baixado = pipeline.download(url)
+                    if baixado is None and url in baixados_antes and Path(baixados_antes[url][0]).exists():
+                        caminho, maintype, subtype, motivo, sha = baixados_antes[url]
+                        baixado = Path(caminho), maintype, subtype, motivo, sha
+                    if baixado is None and orcamento.esgotado(RESERVA_ENVIO_S):
+                        sem_download += 1  # o link continua no corpo do e-mail
+                        continue
+                    try:
+                        if baixado is None:
+                            with metricas.span("download", url):
+                                baixado = baixar_para_anexo(session, url, manifest.get(url), cache)
+                        caminho, maintype, subtype, motivo, sha = baixado
+                    except Exception as e:
+                        caminho, motivo, sha = None, str(e), None
+                    if caminho and diario is not None:
+                        diario.registrar("download", url, [str(caminho), maintype, subtype, None, sha])
+                    if sha:
+                        sha_anterior = _manifest_registrar_sha(conn_manifest, url, sha)
+                        if sha_anterior == sha:
+                            logger.info(f"Conteúdo idêntico ao já registrado (só os cabeçalhos mudaram): {url}")
+                    if caminho:
+                        baixados.append((caminho, maintype, subtype, _filename_from_url(url), url))
+                    elif motivo:
+                        logger.warning(f"Não foi possível anexar {url} | Motivo: {motivo}")
+            cache.close()
+            conn_manifest.close()
+            if sem_download:
+                orcamento.registrar_motivo(f"{sem_download} anexo(s) alterado(s) sem download (só o link no e-mail)")
+
+            with metricas.span("empacotamento"):
+                anexos_email, so_link, temporarios = empacotar_anexos(
+                    baixados, prefixo=f"leiautes_alterados_{datetime.now():%Y%m%d}")
+            for url in so_link:
+                logger.warning(f"Anexo só como link (não coube no e-mail): {_filename_from_url(url)}")
+            if so_link:
+                metricas.contar("anexos_so_link", len(so_link))
+            so_link = set(so_link)
+
             if alterados:
                 blocos_por_categoria = {}
                 for item in alterados:
                     url = item["url"]
                     nome = _filename_from_url(url)
-                    categoria = categoria_por_url.get(url, "Sem categoria")
+                    categoria = categoria_por_url.get(url) or categoria_por_url.get(item.get("vista_como"), "Sem categoria")
                     evidencia = item.get("evidencia", "")
                     link = f'<a href="{url}" target="_blank" style="color:{BLUE_BRAND}; text-decoration:none;">{nome}</a>'
+                    if url in so_link:
+                        link += " <em>(só pelo link: não coube no e-mail)</em>"
                     linha = f"<li>{link}</li>"
                     blocos_por_categoria.setdefault(categoria, []).append(linha)
 
@@ -483,53 +3051,313 @@ def main():
             else:
                 html = gerar_html_sem_novidade(hoje, logo_cid)
 
-            msg.attach(MIMEText(html, "html", "utf-8"))
-
-            with open(LOGO_PATH, "rb") as f:
-                img = MIMEImage(f.read())
-                img.add_header("Content-ID", f"<{logo_cid}>")
-                img.add_header("Content-Disposition", "inline", filename="logo.jpg")
-                msg.attach(img)
-
-            session = _session()
-            total_size = 0
-            for item in alterados:
-                url = item["url"]
-                content, maintype, subtype, motivo = baixar_para_anexo(session, url)
-                if content:
-                    if total_size + len(content) > MAX_TOTAL_ATTACH_SIZE:
-                        logger.warning(f"Anexo ignorado (limite total): {_filename_from_url(url)}")
-                        continue
-                    part = MIMEBase(maintype, subtype)
-                    part.set_payload(content)
-                    encoders.encode_base64(part)
-                    part.add_header("Content-Disposition", "attachment", filename=_filename_from_url(url))
-                    msg.attach(part)
-                    total_size += len(content)
-                elif motivo:
-                    logger.warning(f"Não foi possível anexar {url} | Motivo: {motivo}")
-
             try:
-                smtp_class = smtplib.SMTP_SSL if email_cfg["ssl"] else smtplib.SMTP
-                with smtp_class(email_cfg["host"], email_cfg["port"]) as server:
-                    if email_cfg["tls"]:
-                        server.starttls()
-                    if email_cfg["user"] and email_cfg["password"]:
-                        server.login(email_cfg["user"], email_cfg["password"])
-                    server.sendmail(email_cfg["from"], destinatarios, msg.as_string())
-                logger.info(f"E-mail enviado para: {', '.join(destinatarios)}")
-                emails_enviados = 1
-            except Exception as e:
-                logger.error(f"Erro ao enviar e-mail: {e}")
+                with metricas.span("montagem_email"):
+                    eml = montar_email_em_arquivo(ASSUNTO, email_cfg["from"], destinatarios, html,
+                                                  LOGO_PATH, logo_cid, anexos_email)
+            finally:
+                for tmp in temporarios:
+                    tmp.unlink(missing_ok=True)
+            metricas.contar("anexos_no_email", len(anexos_email))
+            id_email = enfileirar_email(eml, email_cfg["from"], destinatarios, CONFIG_PATH)
+            if diario is not None:
+                diario.registrar("email", "outbox", {"id_email": id_email, "destinatarios": destinatarios})
+                diario.estado("envio_pendente")
+
+    if not replay:
+        # o .eml já está na outbox: nenhum objeto do cache é mais lido nesta execução
+        cache = _cache_db()
+        try:
+            _cache_limpar(cache)
+        finally:
+            cache.close()
+
+    # envia o e-mail desta execução e o que ficou pendente das anteriores
+    if enviar and not replay:
+        with metricas.span("envio_smtp"):
+            entregues = enviar_outbox()
+        emails_enviados = _email_entregue(id_email, entregues, destinatarios)
+        _logar_reenviados(entregues, [id_email])
+    if diario is not None and (id_email is None or emails_enviados):
+        diario.estado("concluida")
 
     return {
+        "paginas": resultados,
+        "anexos_verificados": anexos_detectados,
         "links_detectados_por_data": links_detectados_por_data,
         "alterados": alterados,
+        "anexos_checados": anexos_checados,
+        "anexos_ausentes": anexos_ausentes,
         "emails_enviados": emails_enviados,
         "destinatarios": destinatarios,
         "anexos_nomes": anexos_nomes,
+        "id_email": id_email,
+        "motivos_parciais": list(orcamento.motivos),
     }
 
+def _email_entregue(id_email, entregues, destinatarios):
+    if id_email and id_email in entregues:
+        logger.info(f"E-mail enviado para: {', '.join(destinatarios)}")
+        return 1
+    return 0
+
+def _logar_reenviados(entregues, ids_desta_execucao):
+    reenviados = [i for i in entregues if i not in ids_desta_execucao]
+    if reenviados:
+        logger.info(f"E-mail(s) pendente(s) de execuções anteriores enviados: {', '.join(reenviados)}")
+
+
+# ===== MODO DAEMON =====
+# Processo residente: mantém Chromium e sessão HTTP abertos e checa cada página e
+# cada anexo no seu próprio ritmo. O intervalo é uma fração do tempo desde a última
+# mudança observada (limitado entre o mínimo e o máximo): o que acabou de mudar
+# volta a ser checado logo; o que está parado há meses, raramente.
+DAEMON_INTERVALO_MIN_S = float(os.environ.get("MONITOR_DAEMON_MIN_S", str(15 * 60)))
+DAEMON_INTERVALO_MAX_S = float(os.environ.get("MONITOR_DAEMON_MAX_S", str(12 * 3600)))
+DAEMON_FATOR_INTERVALO = 0.1
+DAEMON_TICK_MAX_S = 60
+
+_SCHEMA_AGENDA = """
+CREATE TABLE IF NOT EXISTS agenda (
+    chave          TEXT PRIMARY KEY,
+    intervalo      REAL NOT NULL,
+    proxima        TEXT NOT NULL,
+    ultima_mudanca TEXT,
+    assinatura     TEXT
+);
+"""
+
+def _intervalo_adaptativo(ultima_mudanca, agora):
+    if not ultima_mudanca:
+        return DAEMON_INTERVALO_MIN_S
+    parado = (agora - datetime.fromisoformat(ultima_mudanca)).total_seconds()
+    return max(DAEMON_INTERVALO_MIN_S, min(DAEMON_INTERVALO_MAX_S, DAEMON_FATOR_INTERVALO * parado))
+
+def _agenda_db():
+    conn = _manifest_db()
+    conn.executescript(_SCHEMA_AGENDA)
+    return conn
+
+def _agenda_devidos(conn, chaves, agora):
+    """Chaves sem agendamento ou com a próxima checagem vencida."""
+    proximas = {row["chave"]: row["proxima"] for row in conn.execute("SELECT chave, proxima FROM agenda")}
+    return [c for c in chaves if proximas.get(c, "") <= agora.isoformat()]
+
+def _agenda_registrar(conn, chave, agora, mudou=None, assinatura=None, falhou=False):
+    """
+    Reagenda `chave`. `mudou` informa se houve mudança; se for None, ela é
+    detectada comparando `assinatura` com a da checagem anterior.
+    """
+    row = conn.execute("SELECT * FROM agenda WHERE chave = ?", (chave,)).fetchone()
+    anterior = row["assinatura"] if row else None
+    if mudou is None:
+        mudou = anterior is not None and assinatura is not None and assinatura != anterior
+    if mudou:
+        ultima = agora.isoformat()
+    elif row is not None and row["ultima_mudanca"]:
+        ultima = row["ultima_mudanca"]
+    else:
+        # primeira vez no agendador: anexos partem da última mudança registrada no histórico
+        ultima = None
+        if chave.startswith("anexo:"):
+            ultima = conn.execute("SELECT MAX(observado_em) FROM historico WHERE url = ?",
+                                  (chave[len("anexo:"):],)).fetchone()[0]
+        ultima = ultima or agora.isoformat()
+    intervalo = DAEMON_INTERVALO_MIN_S if (falhou or mudou) else _intervalo_adaptativo(ultima, agora)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO agenda (chave, intervalo, proxima, ultima_mudanca, assinatura) "
+                     "VALUES (?, ?, ?, ?, ?)",
+                     (chave, intervalo, (agora + timedelta(seconds=intervalo)).isoformat(), ultima,
+                      assinatura if assinatura is not None else anterior))
+
+def _agenda_adiar(conn, chave, quando):
+    """Só antecipa/adia a próxima checagem: o que não foi checado não muda de intervalo."""
+    with conn:
+        conn.execute("INSERT INTO agenda (chave, intervalo, proxima) VALUES (?, ?, ?) "
+                     "ON CONFLICT (chave) DO UPDATE SET proxima = excluded.proxima",
+                     (chave, DAEMON_INTERVALO_MIN_S, quando.isoformat()))
+
+def _agenda_proxima(conn):
+    row = conn.execute("SELECT MIN(proxima) FROM agenda").fetchone()
+    return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+def executar_daemon(parar=None):
+    """Laço do modo daemon (--daemon). Termina com SIGTERM/SIGINT ou quando `parar` é setado."""
+    import signal
+    parar = parar or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: parar.set())
+
+    logger.info(f"Modo daemon: intervalos entre {DAEMON_INTERVALO_MIN_S:g}s e {DAEMON_INTERVALO_MAX_S:g}s")
+    conn = _agenda_db()
+    session = _session()
+    ultimo_email = None
+    with NavegadorCompartilhado() as navegador:
+        while not parar.is_set():
+            _atualizar_data_referencia()
+            agora = datetime.now()
+            paginas = [u[7:] for u in _agenda_devidos(conn, [f"pagina:{u}" for u in urls], agora)]
+
+            conhecidos = {}
+            for url_pag, dados in _load_paginas_cache().items():
+                if url_pag in urls and url_pag not in paginas:
+                    for link in dados.get("anexos", []):
+                        conhecidos[link] = dados.get("categorias", {}).get(link, "Sem categoria")
+            anexos_devidos = set()
+
+            def _filtro(u, agora=agora):
+                if _agenda_devidos(conn, [f"anexo:{u}"], agora):
+                    anexos_devidos.add(u)
+                    return True
+                return False
+
+            if paginas or any(_filtro(u) for u in conhecidos):
+                inicio = datetime.now()
+                metricas.reiniciar()
+                _nova_execucao(paginas=paginas, anexos=len(anexos_devidos))
+                try:
+                    # o e-mail "sem novidades" sai no máximo uma vez por dia
+                    enviar_sem = SEND_EMAIL_WHEN_NO_CHANGES and ultimo_email != hoje
+                    result = main(paginas, navegador, session, conhecidos, _filtro, enviar_sem)
+                    if result["emails_enviados"]:
+                        ultimo_email = hoje
+                    _registrar_execucao(result, inicio, datetime.now(), paginas)
+                except Exception as e:
+                    logger.error(f"Falha na rodada do daemon: {e}\n{traceback.format_exc()}")
+                    _registrar_falha(e)
+                    result = None
+
+                fim = datetime.now()
+                # o que ficou de fora (prazo, host em pausa) não foi checado: volta no próximo ciclo
+                proximo_ciclo = fim + timedelta(seconds=DAEMON_TICK_MAX_S)
+                alterados = {a["url"] for a in (result or {}).get("alterados", [])}
+                checados = (result or {}).get("anexos_checados", {})
+                for url_pag in paginas:
+                    res = (result or {}).get("paginas", {}).get(url_pag)
+                    if isinstance(res, (PrazoEsgotado, HostIndisponivel)):
+                        _agenda_adiar(conn, f"pagina:{url_pag}", proximo_ciclo)
+                    elif result is None or res is None or isinstance(res, Exception):
+                        _agenda_registrar(conn, f"pagina:{url_pag}", fim, falhou=True)
+                    else:
+                        assinatura = _hash_normalizado(json.dumps(res, sort_keys=True, ensure_ascii=False))
+                        _agenda_registrar(conn, f"pagina:{url_pag}", fim, assinatura=assinatura)
+                for u in sorted(anexos_devidos):
+                    if result is None:
+                        _agenda_registrar(conn, f"anexo:{u}", fim, falhou=True)
+                    elif u in checados:
+                        _agenda_registrar(conn, f"anexo:{u}", fim, mudou=u in alterados,
+                                          falhou=checados[u] is not None)
+                    else:
+                        _agenda_adiar(conn, f"anexo:{u}", proximo_ciclo)
+
+            proxima = _agenda_proxima(conn)
+            espera = DAEMON_TICK_MAX_S if proxima is None else (proxima - datetime.now()).total_seconds()
+            parar.wait(max(1.0, min(DAEMON_TICK_MAX_S, espera)))
+    conn.close()
+    logger.info("Modo daemon encerrado.")
+
+
+# ===== MULTIPROJETO =====
+# Vários monitores no mesmo processo (--projetos): cada projeto tem páginas,
+# manifest, config de e-mail/destinatários e status tail próprios; Chromium,
+# sessão HTTP e conexão SMTP são compartilhados. Os projetos rodam em sequência,
+# cada um com as globais acima trocadas pelas suas, e a outbox é esvaziada uma
+# única vez no final.
+PROJETOS_PATH = BASE / "config" / "projetos.json"
+
+def _caminho_projeto(valor):
+    p = Path(valor)
+    return p if p.is_absolute() else BASE / p
+
+def carregar_projetos(path=PROJETOS_PATH):
+    """Lê a lista de projetos (JSON: lista ou {"projetos": [...]}) e completa os padrões."""
+    dados = json.loads(Path(path).read_text(encoding="utf-8"))
+    lista = dados.get("projetos", []) if isinstance(dados, dict) else dados
+    projetos, nomes = [], set()
+    for p in lista:
+        nome = p.get("nome", "")
+        if not re.fullmatch(r"[\w.-]+", nome) or nome in nomes:
+            raise ValueError(f"Nome de projeto inválido ou repetido: {nome!r}")
+        if not p.get("urls"):
+            raise ValueError(f"Projeto {nome} sem urls")
+        nomes.add(nome)
+        manifest = _caminho_projeto(p.get("manifest") or f"scripts/manifest_{nome}.sqlite3")
+        projetos.append({
+            "nome": nome,
+            "urls": list(p["urls"]),
+            "manifest": manifest,
+            "manifest_json": _caminho_projeto(p["manifest_json"]) if p.get("manifest_json") else manifest.with_suffix(".json"),
+            "config_email": _caminho_projeto(p.get("config_email") or CONFIG_PATH),
+            "to": p.get("to") or None,
+            "tail": p.get("tail") or str(Path(TAIL_PATH_BASE).parent.parent / nome / "_status_tail.txt"),
+            "assunto": p.get("assunto"),
+            "especs": p.get("especs") or {},
+        })
+    return projetos
+
+@contextmanager
+def _projeto_ativo(proj, metricas_proj):
+    """Troca as globais do monitor pelas do projeto enquanto ele roda."""
+    global urls, MANIFEST_DB_PATH, MANIFEST_PATH, CONFIG_PATH, DESTINATARIOS, TAIL_PATH_BASE
+    global ASSUNTO, ESPECS_PAGINAS, metricas, PROJETO_ATUAL
+    anteriores = (urls, MANIFEST_DB_PATH, MANIFEST_PATH, CONFIG_PATH, DESTINATARIOS, TAIL_PATH_BASE,
+                  ASSUNTO, ESPECS_PAGINAS, metricas, PROJETO_ATUAL)
+    urls = proj["urls"]
+    MANIFEST_DB_PATH, MANIFEST_PATH = proj["manifest"], proj["manifest_json"]
+    CONFIG_PATH, DESTINATARIOS = proj["config_email"], proj["to"]
+    TAIL_PATH_BASE = proj["tail"]
+    if proj["assunto"]:
+        ASSUNTO = proj["assunto"].format(hoje=hoje)
+    ESPECS_PAGINAS = {**ESPECS_PAGINAS, **proj["especs"]}
+    metricas, PROJETO_ATUAL = metricas_proj, proj["nome"]
+    try:
+        yield
+    finally:
+        (urls, MANIFEST_DB_PATH, MANIFEST_PATH, CONFIG_PATH, DESTINATARIOS, TAIL_PATH_BASE,
+         ASSUNTO, ESPECS_PAGINAS, metricas, PROJETO_ATUAL) = anteriores
+
+def executar_projetos(projetos):
+    """Roda todos os projetos; devolve {nome: resultado da main() ou a exceção}."""
+    with orcamento.execucao():
+        return _executar_projetos(projetos)
+
+def _executar_projetos(projetos):
+    _nova_execucao(projetos=[p["nome"] for p in projetos])
+    session = _session()
+    resultados, execucoes = {}, {}
+    with NavegadorCompartilhado() as navegador:
+        for proj in projetos:
+            logger.info(f"=== Projeto {proj['nome']}: {_plural(len(proj['urls']), 'página')} ===")
+            Path(proj["tail"]).parent.mkdir(parents=True, exist_ok=True)
+            m = Metricas()
+            inicio = datetime.now()
+            with _projeto_ativo(proj, m):
+                try:
+                    resultados[proj["nome"]] = main(navegador=navegador, session=session, enviar=False)
+                    execucoes[proj["nome"]] = (m, inicio, datetime.now())
+                except Exception as e:
+                    logger.error(f"Falha no projeto {proj['nome']}: {e}\n{traceback.format_exc()}")
+                    _registrar_falha(e, proj["nome"])
+                    resultados[proj["nome"]] = e
+
+    # uma conexão SMTP para os e-mails de todos os projetos (e pendências antigas)
+    t0 = time.perf_counter()
+    entregues = enviar_outbox()
+    duracao_envio = time.perf_counter() - t0
+    _logar_reenviados(entregues, [r.get("id_email") for r in resultados.values() if isinstance(r, dict)])
+
+    for proj in projetos:
+        if proj["nome"] not in execucoes:
+            continue
+        m, inicio, fim = execucoes[proj["nome"]]
+        result = resultados[proj["nome"]]
+        m.registrar("envio_smtp", duracao_envio)  # compartilhado entre os projetos
+        result["emails_enviados"] = _email_entregue(result["id_email"], entregues, result["destinatarios"])
+        with _projeto_ativo(proj, m):
+            _registrar_execucao(result, inicio, fim, proj["urls"], proj["nome"])
+    return resultados
+
 
 # ===== Helpers =====
 def _plural(n: int, sing: str, plur: str | None = None) -> str:
@@ -544,117 +3372,238 @@ def _fmt_duracao(delta: timedelta) -> str:
     return f"{h:02d}:{m:02d}:{s:02d}"
 
 
-# ===== MAIN RUN =====
-if __name__ == "__main__":
-    try:
-        inicio_exec = datetime.now()
-        result = main()
-        fim_exec = datetime.now()
-        duracao = _fmt_duracao(fim_exec - inicio_exec)
-
-        links_detectados_por_data = result.get("links_detectados_por_data", [])
-        alterados = result.get("alterados", [])
-        urls_alterados = [a["url"] for a in alterados]
-        links_com_alteracao = not any(
-            any(link.startswith(url_base) for url_base in links_detectados_por_data)
-            for link in urls_alterados
-        )
-        emails_enviados = int(result.get("emails_enviados", 0))
-        destinatarios = result.get("destinatarios", [])
-        anexos_nomes = result.get("anexos_nomes", [])
-        destinatarios_str = ", ".join(destinatarios) if destinatarios else "—"
-
-        paginas_verificadas = len(urls)
-        leiautes_novos = len(links_detectados_por_data)
-        pdfs_gerados = len(alterados)
-
-        logger.info(f"Total de links únicos detectados: {leiautes_novos}")
-        logger.info(f"Documentos alterados: {pdfs_gerados}")
-        logger.info(f"PDFs gerados: {len(anexos_nomes)}")
-        if anexos_nomes:
-            logger.info("Documentos gerados:")
-            for nome in anexos_nomes:
-                logger.info(f" - {nome}")
-        else:
-            logger.info("Nenhum PDF foi gerado.")
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Monitor de leiautes Bacen")
+    ap.add_argument("--importar-manifest", metavar="ARQUIVO_JSON", action="append",
+                    help="importa um manifest JSON antigo para o SQLite e sai (pode repetir)")
+    ap.add_argument("--daemon", action="store_true",
+                    help="fica residente e checa páginas/anexos em intervalos adaptativos")
+    ap.add_argument("--projetos", metavar="ARQUIVO_JSON", nargs="?", const=str(PROJETOS_PATH),
+                    help=f"roda vários projetos num só processo (padrão: {PROJETOS_PATH})")
+    ap.add_argument("--navegador-servidor", choices=("garantir", "parar", "status"),
+                    help="Chromium persistente: sobe/reinicia se não responder, encerra ou mostra o estado, e sai")
+    ap.add_argument("--replay", action="store_true",
+                    help="lê as páginas só dos snapshots em runtime/snapshots (sem Chromium); "
+                         "não grava o manifest nem envia e-mail")
+    ap.add_argument("--execucoes", metavar="N", type=int, nargs="?", const=10,
+                    help="lista as últimas N execuções registradas no log (padrão: 10) e sai")
+    ap.add_argument("--refazer-tail", action="store_true",
+                    help="regrava o _status_tail a partir da última execução no log e sai")
+    return ap.parse_args(argv)
+
+
+def _registrar_execucao(result, inicio_exec, fim_exec, paginas=None, proj="leiautes"):
+    """Loga o resumo da execução e grava o _status_tail."""
+    paginas = urls if paginas is None else paginas
+    duracao = _fmt_duracao(fim_exec - inicio_exec)
+
+    links_detectados_por_data = result.get("links_detectados_por_data", [])
+    alterados = result.get("alterados", [])
+    urls_alterados = [a["url"] for a in alterados]
+    links_com_alteracao = not any(
+        any(link.startswith(url_base) for url_base in links_detectados_por_data)
+        for link in urls_alterados
+    )
+    emails_enviados = int(result.get("emails_enviados", 0))
+    destinatarios = result.get("destinatarios", [])
+    anexos_nomes = result.get("anexos_nomes", [])
+    destinatarios_str = ", ".join(destinatarios) if destinatarios else "—"
+
+    paginas_verificadas = len(paginas)
+    leiautes_novos = len(links_detectados_por_data)
+    pdfs_gerados = len(alterados)
+
+    logger.info(f"Total de links únicos detectados: {leiautes_novos}")
+    logger.info(f"Documentos alterados: {pdfs_gerados}")
+    logger.info(f"PDFs gerados: {len(anexos_nomes)}")
+    if anexos_nomes:
+        logger.info("Documentos gerados:")
+        for nome in anexos_nomes:
+            logger.info(f" - {nome}")
+    else:
+        logger.info("Nenhum PDF foi gerado.")
+
+    logger.info(f"E-mails enviados: {emails_enviados}")
+    logger.info(f"Destinatários: {destinatarios_str}")
+
+    txt_leiautes = _plural(leiautes_novos, "leiaute novo", "leiautes novos")
+    txt_pdfs     = _plural(pdfs_gerados,    "PDF gerado",   "PDFs gerados")
+
+    aviso_tecnico = ""
+
+    if leiautes_novos > 0:
+        header = f"🟢 OK | {txt_leiautes}, {txt_pdfs} | em {duracao}"
+        if leiautes_novos > 0:
+            exemplo_nome = nome_doc_por_url(links_detectados_por_data[0])
+            header += f" | ex: {exemplo_nome}"
+    elif alterados:
+        header = f"🟡 AVISO | Link(s) alterado(s), sem data nova | em {duracao}"
+        aviso_tecnico = "🛈 AVISO TÉCNICO: link(s) foram alterados no Bacen, mesmo sem data nova"
+    else:
+        header = f"🟢 OK | Nenhuma alteração detectada | em {duracao}"
+
+    motivos_parciais = result.get("motivos_parciais", [])
+    if motivos_parciais:
+        for motivo in motivos_parciais:
+            logger.warning(f"Execução parcial: {motivo}")
+        if header.startswith("🟢"):
+            header = f"🟡 AVISO | Execução parcial: {motivos_parciais[0]} | em {duracao}"
+        aviso_tecnico = "\n".join(filter(None, [aviso_tecnico,
+                                                 "🛈 EXECUÇÃO PARCIAL: " + "; ".join(motivos_parciais)]))
+
+    # Gera nomes legíveis dos leiautes verificados
+    codigo_para_sigla = {
+        "2061": "DLO",
+        "2062": "DLI",
+        "DRM": "DRM",
+        "2011": "DDR",
+        "2160": "DRL",
+        "2060": "DRM",
+        "4111": "SCD",
 
-        logger.info(f"E-mails enviados: {emails_enviados}")
-        logger.info(f"Destinatários: {destinatarios_str}")
+    }
 
-        txt_leiautes = _plural(leiautes_novos, "leiaute novo", "leiautes novos")
-        txt_pdfs     = _plural(pdfs_gerados,    "PDF gerado",   "PDFs gerados")
-        
-        aviso_tecnico = ""
-        
-        if leiautes_novos > 0:
-            header = f"🟢 OK | {txt_leiautes}, {txt_pdfs} | em {duracao}"
-            if leiautes_novos > 0:
-                exemplo_nome = nome_doc_por_url(links_detectados_por_data[0])
-                header += f" | ex: {exemplo_nome}"
-        elif alterados:
-            header = f"🟡 AVISO | Link(s) alterado(s), sem data nova | em {duracao}"
-            aviso_tecnico = "🛈 AVISO TÉCNICO: link(s) foram alterados no Bacen, mesmo sem data nova"
-        else:
-            header = f"🟢 OK | Nenhuma alteração detectada | em {duracao}"
-
-        # Gera nomes legíveis dos leiautes verificados
-        codigo_para_sigla = {
-            "2061": "DLO",
-            "2062": "DLI",
-            "DRM": "DRM",
-            "2011": "DDR",
-            "2160": "DRL",
-            "2060": "DRM",
-            "4111": "SCD",
-        
-        }
-        
-        paginas_formatadas = []
-        for url in urls:
-            encontrado = False
-            for codigo, sigla in codigo_para_sigla.items():
-                if codigo in url.upper():
-                    if sigla == "SCD":
-                        paginas_formatadas.append(f"{sigla} - 4111")
-                    if codigo == "DRM":
-                        paginas_formatadas.append("DRM - 2060")
-                    else:
-                        paginas_formatadas.append(f"{sigla} - {codigo}")
-                    encontrado = True
-                    break
-            if not encontrado:
-                trecho = url.rsplit("/", 1)[-1].upper().replace("LEIAUTEDOCUMENTO", "").replace("LEIAUTEDOC", "")
-                if "SCRD" in trecho:  # <- correção
-                    paginas_formatadas.append("SCD - 4111")
+    paginas_formatadas = []
+    for url in paginas:
+        encontrado = False
+        for codigo, sigla in codigo_para_sigla.items():
+            if codigo in url.upper():
+                if sigla == "SCD":
+                    paginas_formatadas.append(f"{sigla} - 4111")
+                if codigo == "DRM":
+                    paginas_formatadas.append("DRM - 2060")
                 else:
-                    paginas_formatadas.append(f"{trecho} - (desconhecido)")        
-        
-        if len(paginas_formatadas) > 1:
-            leiautes_str = ", ".join(paginas_formatadas[:-1]) + " e " + paginas_formatadas[-1]
-        else:
-            leiautes_str = paginas_formatadas[0]
-        
-        resumo = {
-            "📄 Leiautes verificados": leiautes_str,
-            "📊 Leiautes novos": leiautes_novos,
-            "📄 PDFs gerados": pdfs_gerados,
-            "📧 E-mails enviados": emails_enviados,
-            "✉️ Destinatários": destinatarios_str,
-            "📄 Arquivos com mudanças detectadas": "\n- " + "\n- ".join(anexos_nomes) if anexos_nomes else "Nenhum",
-        }
+                    paginas_formatadas.append(f"{sigla} - {codigo}")
+                encontrado = True
+                break
+        if not encontrado:
+            trecho = url.rsplit("/", 1)[-1].upper().replace("LEIAUTEDOCUMENTO", "").replace("LEIAUTEDOC", "")
+            if "SCRD" in trecho:  # <- correção
+                paginas_formatadas.append("SCD - 4111")
+            else:
+                paginas_formatadas.append(f"{trecho} - (desconhecido)")        
+
+    if len(paginas_formatadas) > 1:
+        leiautes_str = ", ".join(paginas_formatadas[:-1]) + " e " + paginas_formatadas[-1]
+    elif paginas_formatadas:
+        leiautes_str = paginas_formatadas[0]
+    else:
+        leiautes_str = "—"
+
+    resumo = {
+        "📄 Leiautes verificados": leiautes_str,
+        "📊 Leiautes novos": leiautes_novos,
+        "📄 PDFs gerados": pdfs_gerados,
+        "📧 E-mails enviados": emails_enviados,
+        "✉️ Destinatários": destinatarios_str,
+        "📄 Arquivos com mudanças detectadas": "\n- " + "\n- ".join(anexos_nomes) if anexos_nomes else "Nenhum",
+        "⏱️ Etapas": metricas.resumo(),
+    }
+    if motivos_parciais:
+        resumo["⚠️ Execução parcial"] = "\n- " + "\n- ".join(motivos_parciais)
 
-        _write_status_tail("leiautes", header, resumo, [], aviso_tecnico)
+    _fim_de_execucao("execucao_fim", proj, header=header, resumo=resumo, extra=aviso_tecnico,
+                     duracao_s=round((fim_exec - inicio_exec).total_seconds(), 3),
+                     leiautes_novos=leiautes_novos, alterados=urls_alterados,
+                     emails_enviados=emails_enviados, motivos_parciais=motivos_parciais)
+    metricas.gravar(proj, sucesso=True)
 
-    except Exception as e:
-        try:
-            resumo_err = {"Motivo": str(e).splitlines()[-1]}
-        except Exception:
-            resumo_err = {"Motivo": str(e)}
+
+def _registrar_falha(e, proj="leiautes"):
+    try:
+        resumo_err = {"Motivo": str(e).splitlines()[-1]}
+    except Exception:
+        resumo_err = {"Motivo": str(e)}
+    try:
+        extra = "Veja o log para o traceback completo."
+        _fim_de_execucao("execucao_falha", proj, logging.ERROR, header="🔴 ERRO | Falha na execução",
+                         resumo=resumo_err, extra=extra)
+    except Exception as log_error:
+        print("Falha ao escrever no status_tail:", log_error)
+    metricas.gravar(proj, sucesso=False)
+
+
+def _fim_de_execucao(nome, proj, nivel=logging.INFO, **dados):
+    """Loga o evento de fim da execução e gera o _status_tail a partir dele."""
+    _evento(nome, dados["header"], nivel, **dados)
+    _status_tail_do_evento({"ts": datetime.now().isoformat(), "proj": proj, "dados": dados})
+
+def _status_tail_do_evento(evento):
+    """O _status_tail é só uma visão do último evento execucao_fim/execucao_falha."""
+    d = evento["dados"]
+    _write_status_tail(evento["proj"], d["header"], d["resumo"], [], d.get("extra"),
+                       quando=datetime.fromisoformat(evento["ts"]))
+
+def _refazer_status_tail(proj="leiautes"):
+    """Regrava o _status_tail com a última execução do projeto registrada no log."""
+    ultimas = consultar_execucoes(1, proj)
+    if not ultimas:
+        return False
+    _status_tail_do_evento(ultimas[0])
+    return True
+
+
+_T_MODULO = time.perf_counter()
+
+
+# ===== MAIN RUN =====
+if __name__ == "__main__":
+    args = _parse_args()
+    if args.execucoes is not None:
+        for ev in reversed(consultar_execucoes(args.execucoes)):
+            d = ev.get("dados", {})
+            print(f"{ev['ts'][:19].replace('T', ' ')} | {ev.get('proj')} | {ev.get('execucao')} | {d.get('header', '')}")
+        sys.exit(0)
+    if args.refazer_tail:
+        sys.exit(0 if _refazer_status_tail() else 1)
+    _configurar_logging()
+    if args.navegador_servidor == "status":
+        versao = navegador_servidor_saudavel()
+        print(f"Chromium persistente na porta {NAVEGADOR_PORTA}: {versao['Browser'] if versao else 'fora do ar'}")
+        sys.exit(0 if versao else 1)
+    if args.navegador_servidor == "parar":
+        sys.exit(0 if parar_navegador_servidor() else 1)
+    if args.navegador_servidor == "garantir":
+        from playwright.sync_api import sync_playwright
+        with sync_playwright() as pw:
+            executavel = pw.chromium.executable_path
+        garantir_navegador_servidor(executavel)
+        sys.exit(0)
+    if args.replay:
+        if args.daemon:
+            sys.exit("--replay não combina com --daemon")
+        MODO_EXTRACAO = "replay"
+    desde_run_sh = ""
+    if os.environ.get("MONITOR_T0_NS", "").isdigit():
+        desde_run_sh = f" ({(time.time_ns() - int(os.environ['MONITOR_T0_NS'])) / 1e6:.0f} ms desde o run.sh)"
+    logger.info(f"Inicialização: módulo carregado em {(_T_MODULO - _T_INICIO) * 1000:.0f} ms, "
+                f"pronto para executar em {(time.perf_counter() - _T_INICIO) * 1000:.0f} ms{desde_run_sh}")
+    if args.importar_manifest:
+        for arq in args.importar_manifest:
+            n = importar_manifest_json(Path(arq))
+            logger.info(f"{n} anexo(s) importado(s) de {arq} para {MANIFEST_DB_PATH}")
+        sys.exit(0)
+    if args.daemon:
+        executar_daemon()
+        sys.exit(0)
+    if args.projetos:
         try:
-            extra = "Veja o log para o traceback completo."
-            _write_status_tail("leiautes", "🔴 ERRO | Falha na execução", resumo_err, [], extra)
-        except Exception as log_error:
-            print("Falha ao escrever no status_tail:", log_error)
+            resultados = executar_projetos(carregar_projetos(Path(args.projetos)))
+        finally:
+            _encerrar_logging()
+            print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | === FIM projetos ===")
+        sys.exit(1 if any(isinstance(r, Exception) for r in resultados.values()) else 0)
+
+    try:
+        inicio_exec = datetime.now()
+        metricas.reiniciar()
+        metricas.registrar("inicializacao", time.perf_counter() - _T_INICIO)
+        _nova_execucao(urls=urls)
+        result = main()
+        _registrar_execucao(result, inicio_exec, datetime.now())
+    except Exception as e:
+        _registrar_falha(e)
         raise
     finally:
+        _encerrar_logging()
         print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | === FIM leiautes ===")